@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import os
+import io
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import tempfile
+import statistics
+import contextlib
+
+from stubServer import start_stub_server
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_DATE = datetime.date(2030, 1, 7)
+SCENARIOS = {
+    "small": {"nb_stations": 4, "breaks_per_hour": 2, "assets_per_break": 4, "days": 1},
+    "medium": {"nb_stations": 16, "breaks_per_hour": 4, "assets_per_break": 8, "days": 1},
+    "large": {"nb_stations": 40, "breaks_per_hour": 6, "assets_per_break": 12, "days": 1},
+    "week": {"nb_stations": 16, "breaks_per_hour": 4, "assets_per_break": 8, "days": 7},
+}
+
+
+def import_scripts(log_dir):
+    """Import the checker and the finder with their logs sent to log_dir. Return both modules."""
+    sys.path.insert(0, REPO_DIR)
+    import zettaSpotBlockChecker
+    import splitStationFinder
+    zettaSpotBlockChecker.setup_logging(log_file=os.path.join(log_dir, "zettaSpotBlockChecker.log"))
+    splitStationFinder.setup_logging(log_file=os.path.join(log_dir, "splitStationFinder.log"))
+    return zettaSpotBlockChecker, splitStationFinder
+
+def time_phase(timings, phase, function, *args):
+    """Run the function and add its duration to the timings of the phase. Return the result of the function."""
+    started = time.perf_counter()
+    result = function(*args)
+    timings.setdefault(phase, []).append(time.perf_counter()-started)
+    return result
+
+def run_finder(finder, config):
+    """Run the finder phases against the stub. Return the list of split stations."""
+    timings = {}
+    # The finder prints every station found
+    with contextlib.redirect_stdout(io.StringIO()):
+        req = time_phase(timings, "finder fetch", finder.request_list_stations, config)
+        finder.check_req_status_code(req)
+        split_stations = time_phase(timings, "finder parse", finder.parse_list_stations, req, config)
+        list_split_stations = time_phase(timings, "finder list", finder.create_list_split_stations, split_stations)
+    return list_split_stations, timings
+
+def check_all(checker, config, list_split_station, dates, use_cache, metrics):
+    """Get and analyse every schedule with the checker, as a check of --from and --to. Return the matrices of each date."""
+    return checker.get_spotBlock_duration_by_date(config, list_split_station, dates, use_cache, metrics=metrics)
+
+def check_pipelined_all(checker, config, list_split_station, dates, use_cache, metrics):
+    """Get every schedule with the pipelined checker, each ETM compared as soon as it is complete. Return the number of violations."""
+    violations_by_date = checker.get_spotBlock_violations_pipelined(config, list_split_station, dates, use_cache, metrics=metrics)[1]
+    return sum(len(violations) for violations in violations_by_date.values())
+
+def get_stub_bodies(server, list_split_station, dates):
+    """Get the raw schedules served by the stub, to time the decoding apart from the requests. Return the bodies."""
+    return {(DATE, split_station["name"]): server.get_schedule_body(split_station["uuid"], DATE) for DATE in dates for split_station in list_split_station}
+
+def parse_all(checker, bodies):
+    """Decode every body into the hourGroups read by the checker. Return the decoded schedules."""
+    return {key: checker.decode_schedule(body) for key, body in bodies.items()}
+
+def parse_stream_all(checker, bodies):
+    """Decode the hourGroups of every body with the streaming parser, 64 KB at a time. Return the number of hourGroups."""
+    nb_hourGroup = 0
+    for body in bodies.values():
+        chunks = (body[i:i+checker.STREAM_CHUNK_SIZE] for i in range(0, len(body), checker.STREAM_CHUNK_SIZE))
+        for hourGroup in checker.iter_hourGroupCollection(chunks):
+            nb_hourGroup += 1
+    return nb_hourGroup
+
+def extract_all(checker, schedules):
+    return {key: checker.analyse_schedule(key[1], schedule) for key, schedule in schedules.items()}
+
+def compare_all(checker, config, list_split_station, dates, spotBlock_durations):
+    """Build the matrix of each date and look for the violations. Return the number of violations."""
+    nb_violations = 0
+    for DATE in dates:
+        matrix = checker.create_spotBlock_matrix([split_station["name"] for split_station in list_split_station])
+        for column, split_station in enumerate(list_split_station):
+            spotBlock_duration_list = spotBlock_durations.get((DATE, split_station["name"]))
+            if spotBlock_duration_list:
+                checker.add_station_to_matrix(matrix, column, spotBlock_duration_list)
+        nb_violations += len(checker.get_spotBlock_violations(config, matrix))
+    return nb_violations
+
+def run_scenario(checker, finder, name, scenario, args):
+    """Run the scenario args.repeat times against a new stub server. Return the timings and the counters."""
+    server = start_stub_server(seed=args.seed, nb_stations=scenario["nb_stations"], breaks_per_hour=scenario["breaks_per_hour"],
+                               assets_per_break=scenario["assets_per_break"], stretch_rate=args.stretch_rate,
+                               latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               compression=not args.no_compression, conditional=not args.no_conditional)
+    config = {"pattern": "Z([0-9]){1,2}", "server": "127.0.0.1", "port": str(server.port), "APIKEY": "benchmark",
+              "authorization": "", "max_stretch": 5, "concurrency": args.concurrency}
+    dates = checker.get_dates_to_check(FIRST_DATE, FIRST_DATE+datetime.timedelta(days=scenario["days"]-1))
+    timings = {}
+    counters = {}
+    try:
+        for i in range(args.repeat):
+            list_split_station, finder_timings = run_finder(finder, config)
+            for phase, durations in finder_timings.items():
+                timings.setdefault(phase, []).extend(durations)
+            with tempfile.TemporaryDirectory() as cache_dir:
+                # The first check fills an empty cache, the second one revalidates every schedule
+                checker.CACHE_DIR = cache_dir+"/"
+                bytes_sent = server.bytes_sent
+                metrics = checker.RunMetrics()
+                time_phase(timings, "check", check_all, checker, config, list_split_station, dates, True, metrics)
+                bytes_sent = server.bytes_sent-bytes_sent
+                cached_metrics = checker.RunMetrics()
+                time_phase(timings, "check cached", check_all, checker, config, list_split_station, dates, True, cached_metrics)
+            nb_pipelined_violations = time_phase(timings, "check pipeline", check_pipelined_all, checker, config, list_split_station, dates, False, checker.RunMetrics())
+            bodies = get_stub_bodies(server, list_split_station, dates)
+            schedules = time_phase(timings, "parse", parse_all, checker, bodies)
+            nb_hourGroup = time_phase(timings, "parse stream", parse_stream_all, checker, bodies)
+            spotBlock_durations = time_phase(timings, "extract", extract_all, checker, schedules)
+            nb_violations = time_phase(timings, "compare", compare_all, checker, config, list_split_station, dates, spotBlock_durations)
+            counters = {"stations": len(list_split_station), "dates": len(dates), "schedules": len(bodies), "errors": len(metrics.failures),
+                        "bytes": sum(len(body) for body in bodies.values()), "bytes sent": bytes_sent,
+                        "not modified": cached_metrics.counters.get("not_modified", 0),
+                        "hourGroups": nb_hourGroup, "violations": nb_violations, "pipelined violations": nb_pipelined_violations}
+    finally:
+        server.shutdown()
+        server.server_close()
+    return timings, counters
+
+def print_results(results):
+    print(f"{'scenario':<10} {'phase':<14} {'min (s)':>10} {'median (s)':>11}")
+    for name, result in results.items():
+        for phase, durations in result["timings"].items():
+            print(f"{name:<10} {phase:<14} {min(durations):>10.4f} {statistics.median(durations):>11.4f}")
+        counters = ", ".join(f"{counter} : {value}" for counter, value in result["counters"].items())
+        print(f"{name:<10} {counters}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the fetch, parse, extract and compare phases of the checker and the finder against a local stub of the Zetta API.")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run. If not, all of them : {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each scenario")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated payloads")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous requests")
+    parser.add_argument("--stretch-rate", type=float, default=0.01, help="Share of the breaks stretched on some stations")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency of the stub, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random latency added on top of --latency, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of the requests the stub answers with a 500")
+    parser.add_argument("--no-compression", help="The stub ignores Accept-Encoding", action="store_true")
+    parser.add_argument("--no-conditional", help="The stub ignores If-None-Match and sends no ETag", action="store_true")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario '{name}', choose from {', '.join(SCENARIOS)}")
+    with tempfile.TemporaryDirectory() as log_dir:
+        checker, finder = import_scripts(log_dir)
+        results = {}
+        for name in args.scenarios or SCENARIOS:
+            timings, counters = run_scenario(checker, finder, name, SCENARIOS[name], args)
+            results[name] = {"timings": timings, "counters": counters}
+        logging.shutdown()
+    print(f"Schedules decoded with {checker.DECODER}")
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import random
+import uuid as uuid_lib
+
+ASSET_TITLES = ["Jingle", "Spot", "Promo", "Sponsor", "Liner"]
+
+
+def generate_uuid(rnd):
+    """Generate a uuid from the random generator, so the same seed gives the same uuids. Return the uuid."""
+    return str(uuid_lib.UUID(int=rnd.getrandbits(128)))
+
+def format_duration(microseconds):
+    """Format a duration in microseconds as Zetta does ('HH:MM:SS.fffffff'). Return the string."""
+    seconds, microseconds = divmod(microseconds, 1000000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{microseconds:06d}0"
+
+def generate_station_list(seed, nb_stations, nb_other_stations=10, nb_background_tasks=5):
+    """Generate the dataObject of /ZettaApi/1.0/Station/list with nb_stations split stations (Z1, Z2...),
+    stations which don't match the pattern and background tasks. Return the payload."""
+    rnd = random.Random(seed)
+    stations = []
+    for i in range(nb_stations):
+        stations.append({"uuid": generate_uuid(rnd), "name": f"Z{i+1}", "role": "station", "callLetters": f"Z{i+1}", "isActive": True})
+    for i in range(nb_other_stations):
+        stations.append({"uuid": generate_uuid(rnd), "name": f"Station {i+1}", "role": "station", "callLetters": f"S{i+1}", "isActive": True})
+    for i in range(nb_background_tasks):
+        stations.append({"uuid": generate_uuid(rnd), "name": f"Task {i+1}", "role": "backgroundTask", "callLetters": "", "isActive": True})
+    rnd.shuffle(stations)
+    return {"dataObject": stations}
+
+def generate_asset_event(rnd, duration):
+    """Generate an asset of a spotBlock with the fields Zetta returns around the duration. Return the event."""
+    return {
+        "type": "asset",
+        "logEventId": rnd.getrandbits(31),
+        "assetEvent": {
+            "assetId": rnd.getrandbits(31),
+            "title": f"{rnd.choice(ASSET_TITLES)} {rnd.getrandbits(16)}",
+            "artist": "",
+            "effectiveTransitions": {
+                "duration": format_duration(duration),
+                "segueStart": format_duration(duration-rnd.randint(0, 500000)),
+                "introEnd": format_duration(0),
+            },
+        },
+    }
+
+def generate_schedule(seed, station_number, date, hours=24, breaks_per_hour=2, assets_per_break=4, stretch_rate=0.0):
+    """Generate the payload of /ZettaApi/1.0/StationScheduleLog/{uuid}/{date} for a split station.
+    The breaks are at the same ETMs and the assets have the same durations on every station of the seed,
+    except for a stretch_rate share of the breaks which get an additional asset on some stations. Return the payload."""
+    # The durations only depend on the seed and the date so that the split stations are comparable
+    rnd = random.Random(f"{seed}-{date}")
+    # The stretched breaks depend on the station too
+    station_rnd = random.Random(f"{seed}-{date}-{station_number}")
+    hourGroupCollection = []
+    for hour in range(hours):
+        logEventCollection = []
+        for break_number in range(breaks_per_hour):
+            minute = (60//breaks_per_hour)*break_number+rnd.randint(0, (60//breaks_per_hour)-1)
+            logEventCollection.append({
+                "type": "exactTimeMarker",
+                "logEventId": rnd.getrandbits(31),
+                "exactTimeMarkerEvent": {"time": f"00:{minute:02d}:00", "isHard": True},
+            })
+            assets = [generate_asset_event(rnd, rnd.randint(5000000, 60000000)) for i in range(assets_per_break)]
+            if station_rnd.random() < stretch_rate:
+                assets.append(generate_asset_event(station_rnd, station_rnd.randint(5000000, 60000000)))
+            logEventCollection.append({
+                "type": "spotBlock",
+                "logEventId": rnd.getrandbits(31),
+                "spotBlockEvent": {"name": f"Break {hour}:{minute:02d}", "logEventCollection": assets},
+            })
+        hourGroupCollection.append({"hour": hour, "logEventCollection": logEventCollection})
+    return {"dataObject": {"date": date, "hourGroupCollection": hourGroupCollection}}
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import threading
+import socketserver
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """Answer just enough of SMTP for smtplib to send mails, and keep them instead of delivering them."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.nb_connection += 1
+        self.reply("220 smtpSink ready")
+        mail = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self.reply("250 smtpSink")
+            elif verb == "HELO" or verb == "NOOP" or verb == "RSET":
+                self.reply("250 OK")
+            elif verb == "MAIL":
+                mail = {"from": command[10:].strip("<>"), "to": [], "data": ""}
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                mail["to"].append(command[8:].strip("<>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line.decode("utf-8", "replace"))
+                mail["data"] = "".join(lines)
+                with server.lock:
+                    server.mails.append(mail)
+                if server.verbose:
+                    print(mail["data"])
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """Local SMTP server keeping the mails it receives in mails, to check the alerts without a mail server.
+    There is no STARTTLS nor login, set starttls to false and no user in the mail of the config."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, verbose=False):
+        super().__init__(address, SmtpSinkHandler)
+        self.lock = threading.Lock()
+        self.mails = []
+        self.nb_connection = 0
+        self.verbose = verbose
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def start_smtp_sink(port=0, verbose=False):
+    """Start the SMTP sink in a background thread, on a free port if port is 0. Return the server."""
+    server = SmtpSink(("127.0.0.1", port), verbose)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Receive the mails of the checker locally and print them.")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+    server = SmtpSink(("127.0.0.1", args.port), verbose=True)
+    print(f"SMTP sink listening on 127.0.0.1:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import re
+import sys
+import gzip
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import http.server
+import email.utils
+
+from scheduleGenerator import generate_station_list, generate_schedule
+
+SCHEDULE_PATH = re.compile(r"^/ZettaApi/1\.0/StationScheduleLog/([^/]+)/([0-9]{4}-[0-9]{2}-[0-9]{2})$")
+STATION_LIST_PATH = "/ZettaApi/1.0/Station/list"
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answer the Zetta API requests used by the checker and the finder with generated payloads."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency+server.rnd.uniform(0, server.jitter))
+        if server.error_rate and server.rnd.random() < server.error_rate:
+            self.send_body(500, b'{"message": "Stub error"}')
+            return
+        if self.path == STATION_LIST_PATH:
+            self.send_body(200, server.get_station_list_body())
+            return
+        match = SCHEDULE_PATH.match(self.path)
+        if match and match.group(1) in server.station_numbers:
+            self.send_schedule(match.group(1), match.group(2))
+        else:
+            self.send_body(404, b'{"message": "Not found"}')
+
+    def send_schedule(self, uuid, date):
+        """Send the schedule, or a 304 if the validators of the request match and the stub supports conditional requests.
+        The body is gzipped if the client accepts it and the stub supports compression."""
+        server = self.server
+        body = server.get_schedule_body(uuid, date)
+        if not server.conditional:
+            self.send_body(200, body)
+            return
+        validators = {"ETag": server.get_etag(body), "Last-Modified": server.last_modified}
+        if self.headers.get("If-None-Match") == validators["ETag"] or (
+                self.headers.get("If-None-Match") is None and self.headers.get("If-Modified-Since") == validators["Last-Modified"]):
+            with server.lock:
+                server.nb_not_modified += 1
+            self.send_response(304)
+            for header, value in validators.items():
+                self.send_header(header, value)
+            self.end_headers()
+            return
+        self.send_body(200, body, validators)
+
+    def send_body(self, status_code, body, headers=None):
+        server = self.server
+        headers = dict(headers or {})
+        if server.compression and "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 1024:
+            body = server.get_gzip_body(body)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """Zetta API stub serving a generated station list and generated schedules, with optional latency and errors.
+    compression and conditional set whether the stub gzips the bodies and answers 304 to the conditional requests, or ignores them."""
+
+    daemon_threads = True
+
+    def __init__(self, address, seed=0, nb_stations=4, hours=24, breaks_per_hour=2, assets_per_break=4,
+                 stretch_rate=0.0, latency=0.0, jitter=0.0, error_rate=0.0, compression=True, conditional=True):
+        super().__init__(address, StubHandler)
+        self.seed = seed
+        self.hours = hours
+        self.breaks_per_hour = breaks_per_hour
+        self.assets_per_break = assets_per_break
+        self.stretch_rate = stretch_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.compression = compression
+        self.conditional = conditional
+        # The schedules don't change while the stub runs
+        self.last_modified = email.utils.formatdate(time.time(), usegmt=True)
+        self.nb_not_modified = 0
+        self.bytes_sent = 0
+        self.rnd = random.Random(seed)
+        self.station_list = generate_station_list(seed, nb_stations)
+        # Number of each split station, used to generate its schedule
+        self.station_numbers = {}
+        for station in self.station_list["dataObject"]:
+            if station["role"] == "station" and station["name"].startswith("Z"):
+                self.station_numbers[station["uuid"]] = int(station["name"][1:])
+        self.bodies = {}
+        self.gzip_bodies = {}
+        self.lock = threading.Lock()
+
+    def get_station_list_body(self):
+        return json.dumps(self.station_list).encode("utf-8")
+
+    def get_schedule_body(self, uuid, date):
+        """Generate the schedule once and keep the body, so the latency is only the one configured."""
+        with self.lock:
+            body = self.bodies.get((uuid, date))
+            if body is None:
+                schedule = generate_schedule(self.seed, self.station_numbers[uuid], date, self.hours,
+                                             self.breaks_per_hour, self.assets_per_break, self.stretch_rate)
+                body = json.dumps(schedule).encode("utf-8")
+                self.bodies[(uuid, date)] = body
+        return body
+
+    def get_gzip_body(self, body):
+        with self.lock:
+            gzip_body = self.gzip_bodies.get(body)
+            if gzip_body is None:
+                gzip_body = gzip.compress(body, compresslevel=6)
+                self.gzip_bodies[body] = gzip_body
+        return gzip_body
+
+    def get_etag(self, body):
+        return '"'+hashlib.sha1(body).hexdigest()[:16]+'"'
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def start_stub_server(**kwargs):
+    """Start a stub server on a free local port in a background thread. Return the server."""
+    server = StubServer(("127.0.0.1", 0), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a generated Zetta API to run the checker and the finder against.")
+    parser.add_argument("--port", type=int, default=3139)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stations", type=int, default=4, help="Number of split stations")
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--breaks", type=int, default=2, help="Breaks per hour")
+    parser.add_argument("--assets", type=int, default=4, help="Assets per break")
+    parser.add_argument("--stretch-rate", type=float, default=0.0, help="Share of the breaks stretched on some stations")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency added to each request, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random latency added on top of --latency, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of the requests answered with a 500")
+    parser.add_argument("--no-compression", help="Ignore Accept-Encoding, as a server without compression", action="store_true")
+    parser.add_argument("--no-conditional", help="Ignore If-None-Match and If-Modified-Since and send no validators", action="store_true")
+    args = parser.parse_args()
+    server = StubServer(("127.0.0.1", args.port), args.seed, args.stations, args.hours, args.breaks, args.assets,
+                        args.stretch_rate, args.latency, args.jitter, args.error_rate, not args.no_compression, not args.no_conditional)
+    print(f"Stub Zetta API listening on http://127.0.0.1:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit()
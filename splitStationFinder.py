@@ -3,7 +3,6 @@
 import os
 import sys
 import json
-from zettaSpotBlockChecker import LIST_SPLIT_STATIONS_FILE
 import requests
 import re
 from requests.api import request
@@ -23,12 +22,17 @@ LOG_FILE = LOCAL_DIR+LOG_FILE_NAME
 
 
 # LOGGING CONFIG
+# Nothing is configured when the module is imported, the handler is added by setup_logging
 logger_file = logging.getLogger("logger_file")
-handler_file = logging.handlers.RotatingFileHandler(LOG_FILE, mode="a", maxBytes= 1000000, backupCount= 5, encoding="utf-8")
-formatter_file = logging.Formatter("%(asctime)s|%(levelname)s|%(message)s")
-handler_file.setFormatter(formatter_file)
-logger_file.setLevel(logging.INFO)
-logger_file.addHandler(handler_file)
+
+def setup_logging(log_file=LOG_FILE):
+    """Send the logs to the rotating log file. Return the handler."""
+    handler_file = logging.handlers.RotatingFileHandler(log_file, mode="a", maxBytes= 1000000, backupCount= 5, encoding="utf-8")
+    formatter_file = logging.Formatter("%(asctime)s|%(levelname)s|%(message)s")
+    handler_file.setFormatter(formatter_file)
+    logger_file.setLevel(logging.INFO)
+    logger_file.addHandler(handler_file)
+    return handler_file
 
 
 def load_config(CONFIG_FILE):
@@ -154,11 +158,15 @@ def write_list_splite_stations_json (LIST_SPLIT_STATIONS_FILE, list_split_statio
         print(f"List split station file was created correctly in '{LIST_SPLIT_STATIONS_OUTPUT_FILE_NAME}'.")
         return None
 
-if __name__ == '__main__':
+def main():
+    setup_logging()
     logger_file.info("STARTUP")
     config = load_config(CONFIG_FILE)
     req = request_list_stations(config)
     if check_req_status_code(req):
         split_stations = parse_list_stations(req, config)
         list_split_stations = create_list_split_stations(split_stations)
-        write_list_splite_stations_json(LIST_SPLIT_STATIONS_OUTPUT_FILE, list_split_stations)
\ No newline at end of file
+        write_list_splite_stations_json(LIST_SPLIT_STATIONS_OUTPUT_FILE, list_split_stations)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmark"))
+
+from stubServer import start_stub_server
+from zettaMetrics import RunMetrics
+from zettaSpotBlockChecker import get_station_patterns, match_split_stations, get_spotBlock_duration_by_date
+
+DATES = ["2026-10-18", "2026-10-19"]
+
+
+def build_config(server, **options):
+    """Build the config of a check against the stub server. Return it."""
+    config = {"pattern": "Z([0-9]){1,2}", "server": "127.0.0.1", "port": str(server.port), "APIKEY": "key", "authorization": "auth",
+              "max_stretch": 5, "concurrency": 3, "retries": 0}
+    config.update(options)
+    return config
+
+def get_stub_split_stations(server, config):
+    return match_split_stations(server.station_list["dataObject"], get_station_patterns(config))
+
+
+class AnalysisWorkersTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server(nb_stations=4, stretch_rate=0.1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def check_same_matrices(self, extra_options):
+        config = build_config(self.server)
+        list_split_station = get_stub_split_stations(self.server, config)
+        self.assertEqual(len(list_split_station), 4)
+        expected = get_spotBlock_duration_by_date(config, list_split_station, DATES)
+        metrics = RunMetrics()
+        result = get_spotBlock_duration_by_date(build_config(self.server, **extra_options), list_split_station, DATES, metrics=metrics)
+        self.assertEqual(metrics.phases["analysis process"]["calls"], len(list_split_station)*len(DATES))
+        self.assertEqual(result.keys(), expected.keys())
+        for DATE, matrices in expected.items():
+            for group, matrix in matrices.items():
+                self.assertTrue(matrix["etms"], DATE)
+                self.assertEqual(matrix["failed"], set(), DATE)
+                for key in ("stations", "etms", "durations", "failed"):
+                    self.assertEqual(result[DATE][group][key], matrix[key], (DATE, group, key))
+
+    def test_analysis_processes_match_request_threads(self):
+        self.check_same_matrices({"analysis_workers": 2})
+
+    def test_streaming_is_ignored_with_analysis_processes(self):
+        with self.assertLogs("zettaSpotBlockChecker", "WARNING") as logs:
+            self.check_same_matrices({"analysis_workers": 2, "streaming": True})
+        self.assertTrue(any("streaming is ignored" in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
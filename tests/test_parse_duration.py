@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import random
+import datetime
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from zettaSchedule import parse_duration, decode_schedule
+from zettaSpotBlockChecker import get_spotBlock_duration
+
+
+def old_get_spotBlock_duration(event, hour_factor=360000000):
+    """get_spotBlock_duration before the durations were parsed to microseconds, with its hour factor. Return the duration in milliseconds, as a string."""
+    spotBlock_duration = datetime.datetime.strptime("00:00:00.00000",'%H:%M:%S.%f')
+    event_logEventCollection = event["spotBlockEvent"]["logEventCollection"]
+    for element in event_logEventCollection:
+        duration_str = element["assetEvent"]["effectiveTransitions"]["duration"][:15]
+        element_duration = datetime.datetime.strptime(duration_str, '%H:%M:%S.%f')
+        spotBlock_duration = spotBlock_duration+datetime.timedelta(hours=element_duration.hour, minutes=element_duration.minute, seconds=element_duration.second, microseconds=element_duration.microsecond)
+    spotBlock_duration = spotBlock_duration.time()
+    return str((spotBlock_duration.hour*hour_factor)+(spotBlock_duration.minute*60000000)+(spotBlock_duration.second*1000000)+spotBlock_duration.microsecond)[:-3]
+
+def build_spotBlock(durations):
+    """Build a spotBlock event as sent by Zetta, with an asset for each duration. Return it."""
+    return {"type": "spotBlock", "spotBlockEvent": {"logEventCollection": [
+        {"assetEvent": {"effectiveTransitions": {"duration": duration}}} for duration in durations]}}
+
+def get_new_spotBlock_duration(durations):
+    """Decode a schedule with a single spotBlock and get its duration with the checker. Return it in microseconds."""
+    body = json.dumps({"dataObject": {"hourGroupCollection": [{"hour": 0, "logEventCollection": [build_spotBlock(durations)]}]}})
+    hourGroupCollection = decode_schedule(body.encode("utf-8"))
+    return get_spotBlock_duration(hourGroupCollection[0].events[0])
+
+def random_asset_duration(rnd, max_minutes):
+    return f"00:{rnd.randrange(max_minutes):02}:{rnd.randrange(60):02}.{rnd.randrange(10000000):07}"
+
+
+class ParseDurationTest(unittest.TestCase):
+
+    def test_sub_hour_blocks_match_old_implementation(self):
+        rnd = random.Random(0)
+        for _ in range(500):
+            durations = [random_asset_duration(rnd, 14) for _ in range(rnd.randint(1, 4))]
+            event = build_spotBlock(durations)
+            self.assertEqual(get_new_spotBlock_duration(durations)//1000, int(old_get_spotBlock_duration(event)), durations)
+
+    def test_blocks_over_an_hour(self):
+        rnd = random.Random(1)
+        for _ in range(200):
+            durations = [random_asset_duration(rnd, 60) for _ in range(rnd.randint(3, 6))]
+            total = sum(parse_duration(duration) for duration in durations)
+            if not 3600000000 <= total < 86400000000:
+                continue
+            event = build_spotBlock(durations)
+            new_duration = get_new_spotBlock_duration(durations)
+            self.assertEqual(new_duration, total)
+            # The old hour factor was 10 times too small, the old implementation is right once it is fixed
+            self.assertNotEqual(new_duration//1000, int(old_get_spotBlock_duration(event)), durations)
+            self.assertEqual(new_duration//1000, int(old_get_spotBlock_duration(event, 3600000000)), durations)
+
+    def test_day_prefixed_durations(self):
+        self.assertEqual(parse_duration("1.02:03:04.5000000"), int(datetime.timedelta(days=1, hours=2, minutes=3, seconds=4.5)/datetime.timedelta(microseconds=1)))
+        self.assertEqual(parse_duration("2.00:00:00"), 2*86400000000)
+        self.assertEqual(get_new_spotBlock_duration(["1.00:00:00.0000000", "00:30:00.2500000"]), (86400+1800)*1000000+250000)
+
+    def test_durations_without_fraction(self):
+        self.assertEqual(parse_duration("00:00:30"), 30000000)
+        self.assertEqual(parse_duration("01:02:03"), 3723000000)
+        self.assertEqual(get_new_spotBlock_duration(["00:00:30", "00:01:00.5"]), 90500000)
+
+    def test_digits_after_microseconds_are_ignored(self):
+        self.assertEqual(parse_duration("00:00:01.1234567"), 1123456)
+        self.assertEqual(parse_duration("00:00:01.5"), 1500000)
+
+
+if __name__ == '__main__':
+    unittest.main()
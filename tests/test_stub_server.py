@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmark"))
+
+import zettaSpotBlockChecker
+from stubServer import start_stub_server
+from zettaMetrics import RunMetrics
+from zettaSchedule import decode_schedule
+from zettaSpotBlockChecker import (create_session, fetch_schedule, load_schedule_cache, get_station_patterns, match_split_stations,
+                                   get_spotBlock_duration_of_station)
+
+DATE = "2026-10-18"
+
+
+def build_config(server, **options):
+    """Build the config of a check against the stub server. Return it."""
+    config = {"pattern": "Z([0-9]){1,2}", "server": "127.0.0.1", "port": str(server.port), "APIKEY": "key", "authorization": "auth",
+              "max_stretch": 5, "concurrency": 3, "retries": 0}
+    config.update(options)
+    return config
+
+
+class StubServerModesTest(unittest.TestCase):
+    """Check the schedules fetched from the stub, with and without compression and conditional requests."""
+
+    def run_modes(self, check):
+        for compression in (True, False):
+            for conditional in (True, False):
+                with self.subTest(compression=compression, conditional=conditional):
+                    server = start_stub_server(nb_stations=2, compression=compression, conditional=conditional)
+                    try:
+                        with tempfile.TemporaryDirectory() as cache_dir, mock.patch.object(zettaSpotBlockChecker, "CACHE_DIR", cache_dir+"/"):
+                            config = build_config(server)
+                            split_station = match_split_stations(server.station_list["dataObject"], get_station_patterns(config))[0]
+                            with create_session(config) as session:
+                                check(server, config, session, split_station)
+                    finally:
+                        server.shutdown()
+                        server.server_close()
+
+    def test_gzip_bodies_are_decoded(self):
+        def check(server, config, session, split_station):
+            req, body = fetch_schedule(config, session, split_station, DATE)
+            original = server.get_schedule_body(split_station["uuid"], DATE)
+            self.assertEqual(req.status_code, 200)
+            self.assertEqual(body, original)
+            if server.compression:
+                self.assertEqual(req.headers.get("Content-Encoding"), "gzip")
+                self.assertLess(req.raw.tell(), len(original))
+            else:
+                self.assertNotIn("Content-Encoding", req.headers)
+                self.assertEqual(req.raw.tell(), len(original))
+        self.run_modes(check)
+
+    def test_cached_runs_are_not_modified(self):
+        def check(server, config, session, split_station):
+            for streaming in (False, True):
+                config["streaming"] = streaming
+                metrics = RunMetrics()
+                first = get_spotBlock_duration_of_station(config, session, split_station, DATE, True, metrics)
+                second = get_spotBlock_duration_of_station(config, session, split_station, DATE, True, metrics)
+                self.assertEqual(second, first)
+                status_codes = [request["status_code"] for request in metrics.get_summary()["requests"]]
+                if not server.conditional:
+                    self.assertEqual(status_codes, [200, 200], streaming)
+                elif streaming:
+                    # The cache of the first loop is used right away
+                    self.assertEqual(status_codes, [304, 304])
+                else:
+                    self.assertEqual(status_codes, [200, 304])
+            # The schedule served from the cache on a 304 is the one of the server
+            station_cache = load_schedule_cache(config, split_station["uuid"], DATE)
+            req, body = fetch_schedule(config, session, split_station, DATE, station_cache=station_cache)
+            original = server.get_schedule_body(split_station["uuid"], DATE)
+            self.assertEqual(req.status_code, 304 if server.conditional else 200)
+            self.assertEqual(body, original)
+            self.assertEqual(repr(decode_schedule(body)), repr(decode_schedule(original)))
+            self.assertEqual(server.nb_not_modified, 4 if server.conditional else 0)
+        self.run_modes(check)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import queue
+import logging
+import smtplib
+import threading
+
+# Child of the checker logger, the alerts go to its log file
+logger = logging.getLogger("zettaSpotBlockChecker.alerts")
+
+
+class AlertDispatcher:
+    """Send the alerts by mail from a background thread, on a single SMTP connection kept open between mails.
+    An alert already sent less than window seconds ago is not sent again, and the alerts queued within
+    digest_delay seconds of each other are sent together in a single digest."""
+
+    def __init__(self, mail_config, state_file=None, window=86400, digest_delay=2, idle_timeout=60):
+        self.mail_config = mail_config
+        self.state_file = state_file
+        self.window = window
+        self.digest_delay = digest_delay
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.sent = self.load_state()
+        self.pending = set()
+        self.queue = queue.Queue()
+        self.smtp = None
+        self.thread = threading.Thread(target=self.run, name="alerts", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load_state(self):
+        """Read the alerts already sent from the state file. Return a dictionnary with the time each alert key was sent."""
+        if self.state_file is None or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            logger.exception("The following exception occurred :")
+            return {}
+
+    def save_state(self):
+        if self.state_file is None:
+            return
+        with self.lock:
+            now = time.time()
+            # The alerts older than the window can be sent again, they are not kept
+            self.sent = {key: sent for key, sent in self.sent.items() if now-sent < self.window}
+            state = dict(self.sent)
+        try:
+            with open(self.state_file+".tmp", "w", encoding="utf-8") as file:
+                json.dump(state, file)
+            os.replace(self.state_file+".tmp", self.state_file)
+        except OSError:
+            logger.exception("The following exception occurred :")
+
+    def send(self, sujet, alerts, header=""):
+        """Queue a mail with the message of each alert of alerts, a list of (key, message). An alert whose key is None is always sent.
+        The alerts already sent within the window or already queued are left out. Return the number of alerts queued."""
+        now = time.time()
+        with self.lock:
+            new_alerts = []
+            for key, message in alerts:
+                if key is not None:
+                    key = "|".join(key)
+                    if now-self.sent.get(key, 0) < self.window or key in self.pending:
+                        logger.info(f"Already alerted : {message.strip()}")
+                        continue
+                    self.pending.add(key)
+                new_alerts.append((key, message))
+        if new_alerts:
+            self.queue.put({"sujet": sujet, "header": header, "alerts": new_alerts})
+        return len(new_alerts)
+
+    def forget(self, keys):
+        """Remove the alerts from the sent ones, so that they are sent again as soon as they happen again."""
+        with self.lock:
+            for key in keys:
+                self.sent.pop("|".join(key), None)
+        self.save_state()
+
+    def close(self, timeout=None):
+        """Send what is still queued right away, then close the SMTP connection."""
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def run(self):
+        is_stopping = False
+        while not is_stopping:
+            try:
+                # An idle connection is closed rather than left to the server timeout
+                item = self.queue.get(timeout=self.idle_timeout if self.smtp is not None else None)
+            except queue.Empty:
+                self.disconnect()
+                continue
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic()+self.digest_delay
+            while True:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline-time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    is_stopping = True
+                    break
+                batch.append(item)
+            self.send_digest(batch)
+        self.disconnect()
+
+    def send_digest(self, batch):
+        """Send the queued mails of batch as a single mail and remember their alerts as sent."""
+        nb_alert = sum(len(item["alerts"]) for item in batch)
+        if len(batch) == 1:
+            sujet = batch[0]["sujet"]
+            message = batch[0]["header"] + "".join(message for key, message in batch[0]["alerts"])
+        else:
+            sujet = f'ZettaSpotBlockChecker - {nb_alert} alert(s) in {len(batch)} report(s) !'
+            message = "\n".join(item["sujet"] + "\n" + item["header"] + "".join(message for key, message in item["alerts"]) for item in batch)
+        keys = [key for item in batch for key, message in item["alerts"] if key is not None]
+        is_sent = self.send_mail(sujet, message)
+        with self.lock:
+            self.pending.difference_update(keys)
+            if is_sent:
+                now = time.time()
+                for key in keys:
+                    self.sent[key] = now
+        if is_sent:
+            self.save_state()
+
+    def connect(self):
+        """Open the SMTP connection, or check that the open one is still alive. Return it."""
+        if self.smtp is not None:
+            try:
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.disconnect()
+        smtp = smtplib.SMTP(self.mail_config.get("server", ""), self.mail_config.get("port", 587), timeout=30)
+        if self.mail_config.get("starttls", True):
+            smtp.starttls()
+        if self.mail_config.get("user"):
+            smtp.login(self.mail_config["user"], self.mail_config.get("password", ""))
+        self.smtp = smtp
+        return smtp
+
+    def disconnect(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.smtp = None
+
+    def send_mail(self, sujet, error_msg):
+        """Send a mail on the SMTP connection, once again on a new connection if it was closed by the server. Return True if it was sent."""
+        fromaddr = self.mail_config.get("from", "")
+        toaddrs = self.mail_config.get("to", [])
+        message = u"""%s \n %s""" % (sujet, error_msg)
+        msg = """\
+From: %s\r\n\
+To: %s\r\n\
+Subject: %s\r\n\
+\r\n\
+%s
+""" % (fromaddr, ", ".join(toaddrs), sujet, message)
+        for attempt in range(2):
+            try:
+                self.connect().sendmail(fromaddr, toaddrs, msg.encode("utf-8"))
+                logger.info("Envoi d'un mail")
+                print("Envoi d'un mail")
+                return True
+            except smtplib.SMTPServerDisconnected:
+                self.smtp = None
+            except (smtplib.SMTPException, OSError):
+                logger.info("Probleme d'envoi du mail")
+                logger.exception("The following exception occurred :")
+                self.disconnect()
+                return False
+        logger.info("Probleme d'envoi du mail")
+        return False
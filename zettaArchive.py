@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import shutil
+import struct
+import hashlib
+import logging
+import argparse
+import datetime
+import tempfile
+import threading
+import contextlib
+
+# The processes appending to the same archive take turns through a lock of the file, where fcntl is available
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Child of the checker logger, the archive goes to its log file
+logger = logging.getLogger("zettaSpotBlockChecker.archive")
+
+# Each record is its header, its metadata in JSON and the raw schedule compressed by zlib
+RECORD_MAGIC = b"ZSA1"
+RECORD_HEADER = struct.Struct("<4sII")
+
+
+def parse_record(archive_map, offset, size):
+    """Read the record at offset of the archive map of size bytes.
+    Return its metadata, the offset and the length of its payload and its end, or None if there is no complete record at offset."""
+    if offset+RECORD_HEADER.size > size:
+        return None
+    magic, meta_length, payload_length = RECORD_HEADER.unpack_from(archive_map, offset)
+    meta_offset = offset+RECORD_HEADER.size
+    end = meta_offset+meta_length+payload_length
+    if magic != RECORD_MAGIC or end > size:
+        return None
+    try:
+        meta = json.loads(archive_map[meta_offset:meta_offset+meta_length])
+    except ValueError:
+        return None
+    if not isinstance(meta, dict) or not {"station", "date", "sha1"} <= meta.keys():
+        return None
+    return meta, meta_offset+meta_length, payload_length, end
+
+def find_next_record(archive_map, offset, size):
+    """Find the first complete record after offset, to go on reading past a corrupt one. Return its offset, or None if there is none."""
+    offset = archive_map.find(RECORD_MAGIC, offset)
+    while offset != -1:
+        if parse_record(archive_map, offset, size) is not None:
+            return offset
+        offset = archive_map.find(RECORD_MAGIC, offset+1)
+    return None
+
+
+class ScheduleArchive:
+    """Append-only file of the raw schedules fetched by the checker, read through mmap.
+    Each record is length-prefixed, so the file is indexed by reading the headers only. A schedule identical to the last
+    one archived for the same station and date is not archived again. Several processes can append to the same archive,
+    each record is written under a lock of the file. A corrupt part of the file is skipped up to the next record.
+    An incomplete record at the end of the file, left by a run which was stopped while writing it, is dropped
+    when the archive is opened to append to it, and only skipped when it is opened readonly."""
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.records = []
+        self.last_sha1 = {}
+        self.end = 0
+        self.map = None
+        self.map_size = 0
+        self.file = None if readonly else open(path, "ab")
+        with self.lock_file():
+            self.load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+
+    @contextlib.contextmanager
+    def lock_file(self):
+        """Hold the lock of the archive file, shared by the processes appending to it. Nothing is locked when it is opened readonly."""
+        if self.file is None or fcntl is None:
+            yield
+            return
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def load_index(self, start=0):
+        """Read the header and the metadata of the records of the file from start. To append, the lock of the file must be held."""
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        if size <= start:
+            self.end = size
+            return
+        with open(self.path, "rb") as file:
+            archive_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(archive_map)
+        offset = start
+        try:
+            while offset < size:
+                record = parse_record(archive_map, offset, size)
+                if record is None:
+                    # The records after a corrupt part are kept, only the end of the file can be incomplete
+                    next_offset = find_next_record(archive_map, offset+1, size)
+                    if next_offset is None:
+                        break
+                    logger.warning(f"The archive {self.path} is corrupt at byte {offset}, {next_offset-offset} byte(s) are skipped.")
+                    offset = next_offset
+                    continue
+                meta, payload_offset, payload_length, offset = record
+                self.add_record(meta, payload_offset, payload_length)
+        finally:
+            archive_map.close()
+        self.end = size
+        if offset < size:
+            if self.readonly:
+                logger.warning(f"The end of the archive {self.path} is not complete, {size-offset} byte(s) are skipped.")
+            else:
+                # With the lock of the file, no other process is writing this record
+                logger.warning(f"The end of the archive {self.path} is not complete, {size-offset} byte(s) are dropped.")
+                os.truncate(self.path, offset)
+                self.end = offset
+
+    def add_record(self, meta, offset, length):
+        self.records.append((meta, offset, length))
+        self.last_sha1[(meta["station"], meta["date"])] = meta["sha1"]
+
+    def append(self, meta, body):
+        """Archive the raw schedule body with meta, a dictionnary with at least 'station' and 'date'.
+        Return True, or False if the schedule is already the last one archived for the station and date."""
+        writer = self.create_writer(meta)
+        writer.write(body)
+        return writer.commit()
+
+    def create_writer(self, meta):
+        """Start archiving a raw schedule written chunk by chunk, with meta as for append. Return the RecordWriter."""
+        return RecordWriter(self, meta)
+
+    def write_record(self, meta, sha1, payload):
+        """Append the record of a schedule whose compressed body is in the file payload, at its end.
+        Return True, or False if the schedule is already the last one archived for the station and date."""
+        with self.lock, self.lock_file():
+            # The records appended by the other processes since the last write are indexed first
+            if os.fstat(self.file.fileno()).st_size != self.end:
+                self.load_index(self.end)
+            if self.last_sha1.get((meta["station"], meta["date"])) == sha1:
+                return False
+            meta = dict(meta, sha1=sha1, archived=time.time())
+            encoded_meta = json.dumps(meta).encode("utf-8")
+            payload_length = payload.tell()
+            payload.seek(0)
+            offset = os.fstat(self.file.fileno()).st_size
+            self.file.write(RECORD_HEADER.pack(RECORD_MAGIC, len(encoded_meta), payload_length)+encoded_meta)
+            shutil.copyfileobj(payload, self.file)
+            self.file.flush()
+            self.end = offset+RECORD_HEADER.size+len(encoded_meta)+payload_length
+            self.add_record(meta, offset+RECORD_HEADER.size+len(encoded_meta), payload_length)
+        return True
+
+    def read(self, offset, length):
+        """Read the raw schedule of the record whose payload is at offset. Return the body."""
+        with self.lock:
+            # The records appended since the file was mapped need a new map
+            if self.map is None or offset+length > self.map_size:
+                if self.map is not None:
+                    self.map.close()
+                if self.file is not None:
+                    self.file.flush()
+                with open(self.path, "rb") as file:
+                    self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.map_size = len(self.map)
+            return zlib.decompress(self.map[offset:offset+length])
+
+    def get_dates(self):
+        return sorted({meta["date"] for meta, offset, length in self.records})
+
+    def get_latest_records(self, DATE):
+        """Find the last schedule archived for each station on DATE. Return a list of (meta, offset, length), in the order the stations were first archived."""
+        latest = {}
+        for meta, offset, length in self.records:
+            if meta["date"] == DATE:
+                latest[meta["station"]] = (meta, offset, length)
+        return list(latest.values())
+
+
+class RecordWriter:
+    """Raw schedule archived while it is downloaded. Its chunks are compressed to a temporary file as they are written,
+    so the body is never held whole in memory, and the record is appended to the archive by commit."""
+
+    def __init__(self, archive, meta):
+        self.archive = archive
+        self.meta = meta
+        self.sha1 = hashlib.sha1()
+        self.compressor = zlib.compressobj()
+        self.payload = tempfile.TemporaryFile()
+
+    @property
+    def closed(self):
+        return self.payload.closed
+
+    def write(self, chunk):
+        self.sha1.update(chunk)
+        self.payload.write(self.compressor.compress(chunk))
+
+    def commit(self):
+        """Append the schedule written to the archive. Return True, or False if it is already the last one archived
+        for the station and date, or if the writer was discarded."""
+        if self.closed:
+            return False
+        try:
+            self.payload.write(self.compressor.flush())
+            return self.archive.write_record(self.meta, self.sha1.hexdigest(), self.payload)
+        finally:
+            self.payload.close()
+
+    def discard(self):
+        """Drop the schedule written, it is not archived."""
+        self.payload.close()
+
+
+def print_info(archive):
+    dates = archive.get_dates()
+    print(f"{archive.path} : {len(archive.records)} schedule(s), {os.path.getsize(archive.path)} bytes")
+    if dates:
+        stations = {meta["station"] for meta, offset, length in archive.records}
+        print(f"{len(dates)} date(s) from {dates[0]} to {dates[-1]}, {len(stations)} station(s)")
+
+def print_backtest(result, thresholds):
+    print(f"{result['dates']} date(s), {result['schedules']} schedule(s), {result['etms']} ETM(s) replayed in {result['duration_seconds']:.2f} s")
+    print(f"{'max_stretch':>11} {'violations':>10} {'dates':>6}")
+    for threshold in thresholds:
+        counts = result["thresholds"][threshold]
+        print(f"{threshold:>11g} {counts['violations']:>10} {counts['dates']:>6}")
+
+def main(argv=None):
+    # Imported here, the checker imports this module
+    import zettaSpotBlockChecker as checker
+    parser = argparse.ArgumentParser(description="Replay the raw schedules archived by the checker, without any request to the server.")
+    parser.add_argument("--archive", help="Archive file", default=checker.ARCHIVE_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="Number of schedules, dates and stations in the archive")
+    parser_backtest = subparsers.add_parser("backtest", help="Count the violations of the archived dates for several max_stretch")
+    parser_backtest.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat, help="First date, YYYY-MM-DD. If not, the first archived date")
+    parser_backtest.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, help="Last date, YYYY-MM-DD. If not, the last archived date")
+    parser_backtest.add_argument("--max-stretch", type=float, nargs="+", help="max_stretch values to test. If not, max_stretch of config.json")
+    parser_backtest.add_argument("--workers", type=int, help="Analysis processes. If not, analysis_workers of config.json")
+    parser_backtest.add_argument("-v", "--verbose", help="Write the debug logs of the replay", action="store_true")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.archive):
+        parser.error(f"no archive '{args.archive}', set archive to true in config.json to archive the schedules")
+    if args.command == "backtest":
+        checker.setup_logging(args.verbose)
+    with ScheduleArchive(args.archive, readonly=True) as archive:
+        if args.command == "info":
+            print_info(archive)
+            return
+        config = checker.load_config(checker.CONFIG_FILE)
+        thresholds = args.max_stretch or [config["max_stretch"]]
+        if args.workers is not None:
+            config["analysis_workers"] = args.workers
+        dates = archive.get_dates()
+        if args.date_from:
+            dates = [DATE for DATE in dates if DATE >= args.date_from.isoformat()]
+        if args.date_to:
+            dates = [DATE for DATE in dates if DATE <= args.date_to.isoformat()]
+        result = checker.backtest_archive(config, archive, dates, thresholds)
+        print_backtest(result, thresholds)
+
+if __name__ == '__main__':
+    sys.exit(main())
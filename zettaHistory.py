@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import sqlite3
+import argparse
+import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    max_stretch REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS durations (
+    date TEXT NOT NULL,
+    etm TEXT NOT NULL,
+    station TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    duration_us INTEGER NOT NULL,
+    run_id INTEGER NOT NULL,
+    PRIMARY KEY (date, etm, station)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS durations_station ON durations (station, date);
+CREATE TABLE IF NOT EXISTS stretches (
+    date TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    etm TEXT NOT NULL,
+    min_us INTEGER,
+    max_us INTEGER,
+    delta_us INTEGER NOT NULL,
+    delta_percent REAL NOT NULL,
+    outlier TEXT,
+    missing TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    PRIMARY KEY (date, grp, etm)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stretches_delta ON stretches (delta_percent, date);
+"""
+
+
+class HistoryStore:
+    """SQLite store of the spotBlock durations of every (date, ETM, station) and of the stretch of every ETM.
+    A date checked again replaces what was stored for it."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def start_run(self, max_stretch):
+        """Add a run of the checker. Return its id."""
+        with self.connection:
+            cursor = self.connection.execute("INSERT INTO runs (started, max_stretch) VALUES (?, ?)", (time.time(), max_stretch))
+        return cursor.lastrowid
+
+    def add_date(self, run_id, DATE, durations, stretches):
+        """Store the durations of DATE, a list of (etm, station, group, duration in µs), and the stretches of its ETMs,
+        a list of (group, stretch). The durations of the stations which are not in durations are kept."""
+        with self.connection:
+            stations = {station for etm, station, group, duration in durations}
+            self.connection.executemany("DELETE FROM durations WHERE date = ? AND station = ?", [(DATE, station) for station in stations])
+            self.connection.executemany("INSERT INTO durations VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(DATE, etm, station, group, duration, run_id) for etm, station, group, duration in durations])
+            groups = {group for group, stretch in stretches}
+            self.connection.executemany("DELETE FROM stretches WHERE date = ? AND grp = ?", [(DATE, group) for group in groups])
+            self.connection.executemany("INSERT INTO stretches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        [(DATE, group, stretch["etm"], stretch["min"], stretch["max"], stretch["delta"], stretch["delta_percent"],
+                                          stretch["outlier"], ",".join(stretch["missing"]), run_id) for group, stretch in stretches])
+
+    def prune(self, max_age_days):
+        """Remove the dates older than max_age_days days. Return the number of durations removed."""
+        date_limit = (datetime.date.today()-datetime.timedelta(days=max_age_days)).isoformat()
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM durations WHERE date < ?", (date_limit,))
+            self.connection.execute("DELETE FROM stretches WHERE date < ?", (date_limit,))
+        return cursor.rowcount
+
+    def get_violations(self, date_from, max_stretch, date_to="9999-12-31"):
+        """Find the ETMs stretched by max_stretch % or more between date_from and date_to. Return a list of rows."""
+        return self.connection.execute(
+            "SELECT date, grp, etm, delta_us, delta_percent, outlier FROM stretches"
+            " WHERE delta_percent >= ? AND date >= ? AND date <= ? ORDER BY date, delta_percent DESC",
+            (max_stretch, date_from, date_to)).fetchall()
+
+    def get_station_drift(self, station, date_from, etm=None):
+        """Compare the durations of the station with the average of the other stations of its group, for each date since date_from.
+        Return a list of (date, number of ETMs, average, min and max difference in µs)."""
+        query = ("SELECT d.date, COUNT(*), AVG(d.duration_us-o.average_us), MIN(d.duration_us-o.average_us), MAX(d.duration_us-o.average_us)"
+                 " FROM durations d JOIN (SELECT date, etm, grp, AVG(duration_us) AS average_us FROM durations"
+                 " WHERE date >= ? AND station != ? GROUP BY date, etm, grp) o USING (date, etm, grp)"
+                 " WHERE d.station = ? AND d.date >= ?")
+        parameters = [date_from, station, station, date_from]
+        if etm is not None:
+            query += " AND d.etm = ?"
+            parameters.append(etm)
+        return self.connection.execute(query+" GROUP BY d.date ORDER BY d.date", parameters).fetchall()
+
+
+def format_ms(duration_us):
+    return f"{duration_us/1000:.0f}"
+
+def print_violations(store, days, max_stretch):
+    date_from = (datetime.date.today()-datetime.timedelta(days=days)).isoformat()
+    rows = store.get_violations(date_from, max_stretch)
+    print(f"{len(rows)} ETM(s) stretched by {max_stretch} % or more since {date_from}")
+    print(f"{'date':<10} {'group':<10} {'ETM':<8} {'delta (ms)':>10} {'delta %':>8}  outlier")
+    for date, group, etm, delta, delta_percent, outlier in rows:
+        print(f"{date:<10} {group:<10} {etm:<8} {format_ms(delta):>10} {delta_percent:>8.2f}  {outlier}")
+
+def print_station_drift(store, station, days, etm=None):
+    date_from = (datetime.date.today()-datetime.timedelta(days=days)).isoformat()
+    rows = store.get_station_drift(station, date_from, etm)
+    print(f"Duration of {station} minus the average of the other stations since {date_from}, in ms")
+    print(f"{'date':<10} {'ETMs':>5} {'average':>9} {'min':>9} {'max':>9}")
+    for date, nb_etm, average, minimum, maximum in rows:
+        print(f"{date:<10} {nb_etm:>5} {format_ms(average):>9} {format_ms(minimum):>9} {format_ms(maximum):>9}")
+
+def main(argv=None):
+    # Imported here, the checker imports this module
+    import zettaSpotBlockChecker as checker
+    parser = argparse.ArgumentParser(description="Query the history of the spotBlock durations stored by the checker.")
+    parser.add_argument("--history", help="History file", default=checker.HISTORY_FILE)
+    subparsers = parser.add_subparsers(dest="query", required=True)
+    parser_violations = subparsers.add_parser("violations", help="ETMs stretched by max_stretch % or more in the last days")
+    parser_violations.add_argument("--days", type=int, default=30)
+    parser_violations.add_argument("--max-stretch", type=float, help="If not, max_stretch of config.json")
+    parser_drift = subparsers.add_parser("drift", help="Duration of a station compared to the other stations, day by day")
+    parser_drift.add_argument("station")
+    parser_drift.add_argument("--days", type=int, default=30)
+    parser_drift.add_argument("--etm", help="Only this ETM, for example 5:15")
+    args = parser.parse_args(argv)
+    with HistoryStore(args.history) as store:
+        if args.query == "violations":
+            max_stretch = args.max_stretch
+            if max_stretch is None:
+                max_stretch = checker.load_config(checker.CONFIG_FILE)["max_stretch"]
+            print_violations(store, args.days, max_stretch)
+        else:
+            print_station_drift(store, args.station, args.days, args.etm)
+
+if __name__ == '__main__':
+    sys.exit(main())
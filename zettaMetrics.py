@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import threading
+import contextlib
+import http.server
+
+METRICS_PREFIX = "zetta_checker"
+
+
+class RunMetrics:
+    """Timings and counters of one check, filled from the main thread and the request threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.started_wall = time.perf_counter()
+        self.duration = None
+        self.phases = {}
+        self.requests = []
+        self.counters = {}
+        self.failures = []
+        self.servers = {}
+
+    def add_phase(self, phase, wall, cpu):
+        """Add a call of the phase with its wall and CPU durations in seconds."""
+        with self.lock:
+            totals = self.phases.setdefault(phase, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            totals["calls"] += 1
+            totals["wall_seconds"] += wall
+            totals["cpu_seconds"] += cpu
+
+    @contextlib.contextmanager
+    def phase(self, phase, cpu_clock=time.process_time):
+        """Time the block as a call of the phase. Use time.thread_time as cpu_clock inside the request threads."""
+        wall_start = time.perf_counter()
+        cpu_start = cpu_clock()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.perf_counter()-wall_start, cpu_clock()-cpu_start)
+
+    def add_request(self, station, date, status_code, latency, size):
+        """Add a request to the Zetta API with its latency in seconds and the bytes transferred."""
+        with self.lock:
+            self.requests.append({"station": station, "date": date, "status_code": status_code, "latency_seconds": latency, "bytes": size})
+
+    def add_failure(self, station, date, error):
+        """Add a station whose schedule couldn't be fetched, it is left out of the check."""
+        with self.lock:
+            self.failures.append({"station": station, "date": date, "error": error})
+
+    def add_server(self, server, result):
+        """Set the result of a Zetta server, a dictionnary of counters, when several servers are checked."""
+        with self.lock:
+            self.servers[server] = dict(result)
+
+    def finish(self):
+        """Stop the duration of the check, the summaries read afterwards keep it."""
+        with self.lock:
+            if self.duration is None:
+                self.duration = time.perf_counter()-self.started_wall
+
+    def count(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0)+value
+
+    def get_summary(self):
+        """Build the machine-readable summary of the run. Return a dictionnary."""
+        with self.lock:
+            duration = self.duration
+            if duration is None:
+                duration = time.perf_counter()-self.started_wall
+            return {
+                "started": self.started,
+                "duration_seconds": duration,
+                "phases": {phase: dict(totals) for phase, totals in self.phases.items()},
+                "requests": list(self.requests),
+                "counters": dict(self.counters),
+                "failures": list(self.failures),
+                "servers": {server: dict(result) for server, result in self.servers.items()},
+            }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.get_summary(), file, indent=2)
+
+    def get_prometheus_text(self):
+        """Format the summary in the Prometheus text exposition format. Return the text."""
+        summary = self.get_summary()
+        lines = []
+        add_prometheus_metric(lines, "run_timestamp_seconds", "gauge", "Start of the check, as a Unix timestamp.", [({}, summary["started"])])
+        add_prometheus_metric(lines, "run_duration_seconds", "gauge", "Wall time of the check.", [({}, summary["duration_seconds"])])
+        phases = summary["phases"].items()
+        add_prometheus_metric(lines, "phase_wall_seconds", "gauge", "Wall time spent in each phase, summed over its calls.",
+                              [({"phase": phase}, totals["wall_seconds"]) for phase, totals in phases])
+        add_prometheus_metric(lines, "phase_cpu_seconds", "gauge", "CPU time spent in each phase, summed over its calls.",
+                              [({"phase": phase}, totals["cpu_seconds"]) for phase, totals in phases])
+        add_prometheus_metric(lines, "phase_calls", "gauge", "Number of calls of each phase.",
+                              [({"phase": phase}, totals["calls"]) for phase, totals in phases])
+        requests = summary["requests"]
+        # A retried schedule has several requests, only the last one is exported
+        last_requests = {(request["station"], request["date"]): request for request in requests}
+        add_prometheus_metric(lines, "request_latency_seconds", "gauge", "Latency of the schedule request of each station.",
+                              [({"station": station, "date": date}, request["latency_seconds"]) for (station, date), request in last_requests.items()])
+        add_prometheus_metric(lines, "response_bytes", "gauge", "Bytes transferred for the schedule of each station, after compression.",
+                              [({"station": station, "date": date}, request["bytes"]) for (station, date), request in last_requests.items()])
+        status_codes = {}
+        for request in requests:
+            status_codes[request["status_code"]] = status_codes.get(request["status_code"], 0)+1
+        add_prometheus_metric(lines, "requests", "gauge", "Number of requests by status code.",
+                              [({"status_code": status_code}, value) for status_code, value in status_codes.items()])
+        add_prometheus_metric(lines, "failed_stations", "gauge", "Number of stations whose schedule couldn't be fetched, by date.",
+                              [({"date": date}, sum(1 for failure in summary["failures"] if failure["date"] == date)) for date in sorted({failure["date"] for failure in summary["failures"]})])
+        counters_of_servers = sorted({counter for result in summary["servers"].values() for counter in result})
+        for counter in counters_of_servers:
+            add_prometheus_metric(lines, f"server_{counter}", "gauge", f"Number of {counter} of each Zetta server.",
+                                  [({"server": server}, result[counter]) for server, result in summary["servers"].items() if counter in result])
+        for counter, value in summary["counters"].items():
+            add_prometheus_metric(lines, counter, "gauge", f"Number of {counter} processed by the check.", [({}, value)])
+        return "\n".join(lines)+"\n"
+
+    def write_prometheus(self, path):
+        """Write the metrics for the textfile collector of node_exporter. The file is replaced at once."""
+        with open(path+".tmp", "w", encoding="utf-8") as file:
+            file.write(self.get_prometheus_text())
+        # Rename so the collector never reads a half-written file
+        os.replace(path+".tmp", path)
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def add_prometheus_metric(lines, name, metric_type, help_text, samples):
+    """Add the HELP, TYPE and sample lines of a metric. samples is a list of (labels, value)."""
+    if not samples:
+        return
+    full_name = f"{METRICS_PREFIX}_{name}"
+    lines.append(f"# HELP {full_name} {help_text}")
+    lines.append(f"# TYPE {full_name} {metric_type}")
+    for labels, value in samples:
+        if labels:
+            formated_labels = ",".join(f'{label}="{escape_label_value(label_value)}"' for label, label_value in labels.items())
+            lines.append(f"{full_name}{{{formated_labels}}} {value}")
+        else:
+            lines.append(f"{full_name} {value}")
+
+def serve_prometheus(port, get_metrics):
+    """Serve the Prometheus text of the metrics returned by get_metrics on http://0.0.0.0:port/metrics,
+    in a background thread. Return the server."""
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            metrics = get_metrics()
+            if self.path != "/metrics" or metrics is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = metrics.get_prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+from typing import List, Optional, Union
+
+# msgspec only decodes the fields of the schedule the checker reads, orjson decodes it faster than json
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if msgspec is not None:
+    DECODER = "msgspec"
+elif orjson is not None:
+    DECODER = "orjson"
+else:
+    DECODER = "json"
+
+ETM_TYPE = "exactTimeMarker"
+SPOT_BLOCK_TYPE = "spotBlock"
+
+
+class LogEvent:
+    """Event of a logEventCollection, with only what the checker reads : its type, the time of an exactTimeMarker
+    and the total duration in microseconds of the assets of a spotBlock."""
+
+    __slots__ = ("type", "time", "duration")
+
+    def __init__(self, event_type, time=None, duration=None):
+        self.type = event_type
+        self.time = time
+        self.duration = duration
+
+    def __repr__(self):
+        return f"LogEvent({self.type!r}, {self.time!r}, {self.duration!r})"
+
+
+class HourGroup:
+    """Hour of a schedule with its events. events is None if the hour has no logEventCollection."""
+
+    __slots__ = ("hour", "events")
+
+    def __init__(self, hour, events=None):
+        self.hour = hour
+        self.events = events
+
+    def __repr__(self):
+        return f"HourGroup({self.hour!r}, {self.events!r})"
+
+
+def parse_duration(duration_str):
+    """Convert a duration '[D.]HH:MM:SS[.fffffff]' to microseconds. Digits after the microseconds are ignored. Return an int."""
+    hours, minutes, seconds = duration_str.split(":")
+    days, _, hours = hours.rpartition(".")
+    seconds, _, fraction = seconds.partition(".")
+    microseconds = int(fraction[:6].ljust(6, "0"))
+    total_hours = int(days or 0)*24+int(hours)
+    return ((total_hours*60+int(minutes))*60+int(seconds))*1000000+microseconds
+
+def decode_event(event):
+    """Keep what the checker reads of an event decoded by json. Return the LogEvent."""
+    # A single string for each type instead of one by event
+    event_type = sys.intern(event["type"])
+    if event_type == ETM_TYPE:
+        return LogEvent(event_type, (event.get("exactTimeMarkerEvent") or {}).get("time"))
+    if event_type == SPOT_BLOCK_TYPE:
+        return LogEvent(event_type, None, sum(parse_duration(element["assetEvent"]["effectiveTransitions"]["duration"])
+                                              for element in event["spotBlockEvent"]["logEventCollection"]))
+    return LogEvent(event_type)
+
+def decode_hourGroup(hourGroup):
+    """Keep what the checker reads of an hourGroup decoded by json. Return the HourGroup."""
+    logEventCollection = hourGroup.get("logEventCollection")
+    if logEventCollection is None:
+        return HourGroup(hourGroup["hour"])
+    return HourGroup(hourGroup["hour"], [decode_event(event) for event in logEventCollection])
+
+def loads(body):
+    """Decode a JSON document with orjson if it is installed. Return the document."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+if msgspec is not None:
+    # The fields which are not declared are skipped by the decoder without being built
+    class EffectiveTransitions(msgspec.Struct):
+        duration: str
+
+    class AssetEvent(msgspec.Struct):
+        effectiveTransitions: EffectiveTransitions
+
+    class AssetElement(msgspec.Struct):
+        assetEvent: AssetEvent
+
+    class SpotBlockEvent(msgspec.Struct):
+        logEventCollection: List[AssetElement] = []
+
+    class ExactTimeMarkerEvent(msgspec.Struct):
+        time: Optional[str] = None
+
+    class Event(msgspec.Struct):
+        type: str
+        exactTimeMarkerEvent: Optional[ExactTimeMarkerEvent] = None
+        spotBlockEvent: Optional[SpotBlockEvent] = None
+
+    class RawHourGroup(msgspec.Struct):
+        hour: Union[int, str]
+        logEventCollection: Optional[List[Event]] = None
+
+    class DataObject(msgspec.Struct):
+        hourGroupCollection: List[RawHourGroup]
+
+    class Schedule(msgspec.Struct):
+        dataObject: Optional[DataObject] = None
+
+    schedule_decoder = msgspec.json.Decoder(Schedule)
+
+    def convert_event(event):
+        """Keep what the checker reads of an event decoded by msgspec. Return the LogEvent."""
+        event_type = sys.intern(event.type)
+        if event_type == ETM_TYPE:
+            return LogEvent(event_type, event.exactTimeMarkerEvent.time if event.exactTimeMarkerEvent is not None else None)
+        if event_type == SPOT_BLOCK_TYPE:
+            return LogEvent(event_type, None, sum(parse_duration(element.assetEvent.effectiveTransitions.duration)
+                                                  for element in event.spotBlockEvent.logEventCollection))
+        return LogEvent(event_type)
+
+    def convert_hourGroup(hourGroup):
+        """Keep what the checker reads of an hourGroup decoded by msgspec. Return the HourGroup."""
+        if hourGroup.logEventCollection is None:
+            return HourGroup(hourGroup.hour)
+        return HourGroup(hourGroup.hour, [convert_event(event) for event in hourGroup.logEventCollection])
+
+def decode_schedule(body):
+    """Decode the raw schedule of a station, keeping only the fields the checker reads.
+    Return the list of HourGroup of its hourGroupCollection, or None if the schedule has no dataObject."""
+    if msgspec is not None:
+        dataObject = schedule_decoder.decode(body).dataObject
+        if dataObject is None:
+            return None
+        return [convert_hourGroup(hourGroup) for hourGroup in dataObject.hourGroupCollection]
+    dataObject = loads(body).get("dataObject")
+    if dataObject is None:
+        return None
+    return [decode_hourGroup(hourGroup) for hourGroup in dataObject["hourGroupCollection"]]
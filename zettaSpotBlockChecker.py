@@ -4,23 +4,32 @@ import os
 import sys
 import json
 import requests
+import urllib3
 import logging
 import logging.handlers
 import datetime
 import argparse
-import smtplib
-
-# PARSING THE ARGUMENTS
-parser = argparse.ArgumentParser()
-parser.add_argument("-v", "--verbose", help="Set log level to debug",
-                    action="store_true")
-parser.add_argument("-d", "--delta", help="Set the delta of day(s) from today to check. If not, delta is 0", type=int, default=0)
-args = parser.parse_args()
-if args.verbose:
-    logging_level = "DEBUG"
-else:
-    logging_level = "INFO"
-delta = args.delta
+import concurrent.futures
+import codecs
+import itertools
+import re
+import gzip
+import hashlib
+import time
+import array
+import contextlib
+import atexit
+import queue
+import multiprocessing
+import random
+import threading
+import sqlite3
+from requests.adapters import HTTPAdapter
+from zettaMetrics import RunMetrics, serve_prometheus
+from zettaAlerts import AlertDispatcher
+from zettaHistory import HistoryStore
+from zettaSchedule import DECODER, decode_schedule, decode_hourGroup
+from zettaArchive import ScheduleArchive
 
 # CONFIG
 LOCAL_DIR = os.path.dirname(os.path.abspath(__file__))+"/"
@@ -30,61 +39,149 @@ LIST_SPLIT_STATIONS_FILE_NAME = 'splitStations.json'
 LIST_SPLIT_STATIONS_FILE = LOCAL_DIR+LIST_SPLIT_STATIONS_FILE_NAME
 LOG_FILE_NAME = 'zettaSpotBlockChecker.log'
 LOG_FILE = LOCAL_DIR+LOG_FILE_NAME
-DATE = (datetime.datetime.today()+datetime.timedelta(days=delta)).strftime("%Y-%m-%d")
+CACHE_DIR = LOCAL_DIR+'cache/'
+CACHE_VERSION = 5
+STATION_DISCOVERY_FILE = CACHE_DIR+'stations.json'
+ALERT_STATE_FILE = LOCAL_DIR+'alerts.json'
+HISTORY_FILE = LOCAL_DIR+'history.sqlite'
+ARCHIVE_FILE = LOCAL_DIR+'schedules.archive'
+DEFAULT_GROUP = 'default'
+DEFAULT_SERVER = 'default'
+MISSING_DURATION = -1
+STREAM_CHUNK_SIZE = 65536
+HOUR_GROUP_COLLECTION_START = re.compile(r'"hourGroupCollection"\s*:\s*\[')
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+LOG_FORMAT = "%(asctime)s|%(levelname)s|%(message)s"
 
 # LOGGING CONFIG
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-formatter_file = logging.Formatter("%(asctime)s|%(levelname)s|%(message)s")
-handler_file = logging.handlers.RotatingFileHandler(LOG_FILE, mode="a", maxBytes= 1000000, backupCount= 5, encoding="utf-8")
-handler_file.setFormatter(formatter_file)
-if args.verbose:
-    handler_file.setLevel(logging.DEBUG)
-else:
-    handler_file.setLevel(logging.INFO)
-
-# handler_smtp = logging.handlers.SMTPHandler(
-#               mailhost = ("", 587),
-#               fromaddr = "",
-#               toaddrs = ["", ""],
-#               subject = "ZettaSpotBlockChecker",
-#               credentials=("", "")
-# #             )
-# handler_smtp.setLevel(logging.CRITICAL)
-# handler_smtp.setFormatter(formatter_file)
-
-logger.addHandler(handler_file)
-# logger.addHandler(handler_smtp)
-
-def sendMail(nb_error, error_msg):
-    server = smtplib.SMTP('')
-    # .set_debuglevel(1)
-    server.connect('', 587)
-    server.starttls()
-    server.login('', '')
-    # server.ehlo()
-    fromaddr = ''
-    toaddrs = ['', '']
-    sujet = f'ZettaSpotBlockChecker - {nb_error} error(s) found !'
-    message = u"""ZettaSpotBlockChecker - %s error(s) found ! \n %s""" % (nb_error, error_msg)
-    msg = """\
-From: %s\r\n\
-To: %s\r\n\
-Subject: %s\r\n\
-\r\n\
-%s
-""" % (fromaddr, ", ".join(toaddrs), sujet, message)
+# Nothing is configured when the module is imported, the handlers are added by setup_logging
+logger = logging.getLogger("zettaSpotBlockChecker")
+
+def parse_args(argv=None):
+    """Parse the arguments of the command line. Return them."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="Set log level to debug",
+                        action="store_true")
+    parser.add_argument("-d", "--delta", help="Set the delta of day(s) from today to check. If not, delta is 0", type=int, default=0)
+    parser.add_argument("--from", dest="date_from", help="Check every day from this date (YYYY-MM-DD). Replace --delta", type=datetime.date.fromisoformat)
+    parser.add_argument("--to", dest="date_to", help="Last day to check (YYYY-MM-DD) when --from is set. If not, only the --from day is checked", type=datetime.date.fromisoformat)
+    parser.add_argument("--watch", help="Stay running and check today and the next watch_days day(s) every watch_interval seconds. Only new and resolved errors are sent", action="store_true")
+    parser.add_argument("--metrics", help="Write the timings and counters of the run to this JSON file")
+    parser.add_argument("--prometheus", help="Write the metrics of the run to this file, in the Prometheus text format")
+    parser.add_argument("--prometheus-port", help="With --watch, serve the metrics of the last check on this port at /metrics", type=int)
+    parser.add_argument("--no-cache", help="Do not read nor write the schedule cache", action="store_true")
+    parser.add_argument("--json-log", help="Also write the logs to this file as JSON lines")
+    args = parser.parse_args(argv)
+    if args.date_to and not args.date_from:
+        parser.error("--to needs --from, the first day to check")
+    return args
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format a log record as a JSON object on a single line."""
+
+    def format(self, record):
+        return json.dumps({"time": self.formatTime(record), "timestamp": record.created, "level": record.levelname,
+                           "logger": record.name, "process": record.process, "thread": record.threadName,
+                           "message": record.getMessage()}, ensure_ascii=False)
+
+def create_log_file_handler(log_file, level, is_json=False):
+    """Create the rotating handler writing the logs of level or above to log_file, as JSON lines if is_json is True. Return it."""
+    handler_file = logging.handlers.RotatingFileHandler(log_file, mode="a", maxBytes= 1000000, backupCount= 5, encoding="utf-8")
+    if is_json:
+        handler_file.setFormatter(JsonLinesFormatter())
+    else:
+        handler_file.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler_file.setLevel(level)
+    return handler_file
+
+def setup_logging(verbose=False, log_file=LOG_FILE, json_log_file=None):
+    """Send the logs to the rotating log file, at debug level if verbose is True, and to json_log_file as JSON lines if it is set.
+    The records are only queued by the threads which log them, the files are written by a background thread. Return the listener."""
+    level = logging.DEBUG if verbose else logging.INFO
+    # The debug messages of the hot loops are not even built when the level is INFO
+    logger.setLevel(level)
+    handlers = [create_log_file_handler(log_file, level)]
+    if json_log_file:
+        handlers.append(create_log_file_handler(json_log_file, level, is_json=True))
+
+    # handler_smtp = logging.handlers.SMTPHandler(
+    #               mailhost = ("", 587),
+    #               fromaddr = "",
+    #               toaddrs = ["", ""],
+    #               subject = "ZettaSpotBlockChecker",
+    #               credentials=("", "")
+    # #             )
+    # handler_smtp.setLevel(logging.CRITICAL)
+    # handler_smtp.setFormatter(formatter_file)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    handler_queue = logging.handlers.QueueHandler(log_queue)
+    handler_queue.listener = listener
+    logger.addHandler(handler_queue)
+    # logger.addHandler(handler_smtp)
+    listener.start()
+    # Write the records still queued before the program ends
+    atexit.register(listener.stop)
+    return listener
+
+def get_date(delta=0):
+    """Get the date delta day(s) from today. Return the date as YYYY-MM-DD."""
+    return (datetime.datetime.today()+datetime.timedelta(days=delta)).strftime("%Y-%m-%d")
+
+def create_alert_dispatcher(config):
+    """Start the background sending of the alerts by mail, with the mail of the config.
+    The alerts already sent less than alert_window seconds ago are left out. Return the dispatcher."""
+    return AlertDispatcher(config.get("mail", {}), ALERT_STATE_FILE, config.get("alert_window", 86400), config.get("alert_digest_delay", 2))
+
+def create_archive(config):
+    """Open the archive of the raw schedules if archive is set in the config. Return the archive or None."""
+    if not config.get("archive", False):
+        return None
+    try:
+        return ScheduleArchive(ARCHIVE_FILE)
+    except:
+        logger.exception("The following exception occurred :")
+        sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+
+def get_archive_meta(split_station, DATE):
+    """Build the metadata archived with the raw schedule of the split station for DATE. Return it."""
+    return {"station": split_station["name"], "uuid": split_station["uuid"], "group": get_station_group(split_station),
+            "server": split_station.get("server", DEFAULT_SERVER), "date": DATE}
+
+def archive_schedule(archive, split_station, DATE, body):
+    """Append the raw schedule of the split station for DATE to the archive, if there is one."""
+    if archive is None:
+        return
+    try:
+        archive.append(get_archive_meta(split_station, DATE), body)
+    except OSError:
+        # The archive is not worth failing the check
+        logger.exception("The following exception occurred :")
+
+def create_archive_writer(archive, split_station, DATE):
+    """Start archiving the raw schedule of the split station for DATE while it is downloaded.
+    Return the RecordWriter, or None if there is no archive or if the schedule can't be archived."""
+    if archive is None:
+        return None
+    try:
+        return archive.create_writer(get_archive_meta(split_station, DATE))
+    except OSError:
+        logger.exception("The following exception occurred :")
+        return None
+
+def commit_archive_writer(archive_writer):
+    """Append the raw schedule written to archive_writer to the archive, if there is one."""
+    if archive_writer is None:
+        return
     try:
-        server.sendmail(fromaddr, toaddrs, msg)
-        logger.info("Envoi d'un mail")
-        print("Envoi d'un mail")
-    except smtplib.SMTPException as e:
-        logger.info("Probleme d'envoi du mail")
+        archive_writer.commit()
+    except OSError:
         logger.exception("The following exception occurred :")
-        print(e)
-    server.quit()
 
+def get_alert_key(DATE, etm, station_names):
+    """Build the key of the alert of an ETM, which is not sent again for the same date and stations. Return it."""
+    return (DATE, etm, ",".join(sorted(station_names)))
 
 def load_config(CONFIG_FILE):
     """Read splitStationFinder.json and check the config."""
@@ -111,22 +208,280 @@ def load_list_split_station(LIST_SPLIT_STATIONS_FILE):
     else:
         return list_split_station
 
-def request_schedule(config, uuid, DATE):
-    """Get schedule of the station identified by uuid. Return the request."""
+def get_concurrency(config):
+    """Read the number of simultaneous requests allowed in the config. Return it."""
+    concurrency = config.get("concurrency", 1)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        logger.error(f"concurrency must be an integer greater than 0, not '{concurrency}'.")
+        sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    return concurrency
+
+def create_session(config):
+    """Create a keep-alive session shared by all the requests to the server. Return the session."""
+    session = requests.Session()
+    concurrency = get_concurrency(config)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    return session
+
+def get_headers(config):
+    """Build the headers of the requests to the Zetta API. Return them."""
+    return {'user-agent': 'advanced-rest-client','accept': 'application/json','accept-encoding': 'gzip, deflate','APIKEY': config['APIKEY'],'authorization': 'Basic '+ config['authorization']}
+
+def request_station_list(config, session=None):
+    """Get list of station available on the server. Connection errors, timeouts and 5xx are retried as the schedules are. Return the request."""
     try:
-        url = f"http://{config['server']}:{config['port']}/ZettaApi/1.0/StationScheduleLog/{uuid}/{DATE}"
-        headers = {'user-agent': 'advanced-rest-client','accept': 'application/json','APIKEY': config['APIKEY'],'authorization': 'Basic '+ config['authorization']}
+        url = f"http://{config['server']}:{config['port']}/ZettaApi/1.0/Station/list"
+        headers = get_headers(config)
     except:
         logger.exception("The following exception occurred :")
         sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    retries = config.get("retries", 3)
+    attempt = 0
+    while True:
+        try:
+            if session:
+                req = session.get(url, headers=headers, timeout=get_request_timeout(config))
+            else:
+                req = requests.get(url, headers=headers, timeout=get_request_timeout(config))
+        except requests.RequestException as e:
+            if attempt >= retries:
+                logger.exception("The following exception occurred :")
+                sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+            error = f"{type(e).__name__} : {e}"
+        else:
+            # The other errors are left to check_req_status_code
+            if req.status_code < 500 or attempt >= retries:
+                return req
+            error = f"{req.status_code} - Request NOK"
+        delay = get_retry_delay(config, attempt)
+        attempt += 1
+        logger.warning(f"Station list : {error}, retry {attempt}/{retries} in {delay:.2f} s")
+        time.sleep(delay)
+
+def get_request_timeout(config, deadline=None):
+    """Read the timeout of a request to the Zetta API in the config, in seconds.
+    If deadline (time.monotonic) is given, the timeout doesn't go beyond it. Return it."""
+    timeout = config.get("request_timeout", 30)
+    if deadline is not None:
+        timeout = max(0.01, min(timeout, deadline-time.monotonic()))
+    return timeout
+
+def get_retry_delay(config, attempt):
+    """Draw the random wait before a new request, of up to retry_backoff*2^attempt seconds. Return it."""
+    return random.uniform(0, config.get("retry_backoff", 0.5)*2**attempt)
+
+def request_schedule(config, uuid, DATE, session=None, stream=False, conditional_headers=None, deadline=None):
+    """Get schedule of the station identified by uuid. Return the request.
+    If stream is True, the body is not downloaded until it is read. conditional_headers are added to the headers.
+    Raise FetchError if the server can't be reached, or doesn't answer before deadline (time.monotonic)."""
     try:
-        req = requests.get(url, headers=headers)
+        url = f"http://{config['server']}:{config['port']}/ZettaApi/1.0/StationScheduleLog/{uuid}/{DATE}"
+        headers = get_headers(config)
+        if conditional_headers:
+            headers.update(conditional_headers)
     except:
         logger.exception("The following exception occurred :")
         sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    try:
+        if session:
+            req = session.get(url, headers=headers, stream=stream, timeout=get_request_timeout(config, deadline))
+        else:
+            req = requests.get(url, headers=headers, stream=stream, timeout=get_request_timeout(config, deadline))
+    except requests.RequestException as e:
+        raise FetchError(f"{type(e).__name__} : {e}") from e
     else:
         return req
 
+class FetchError(Exception):
+    """The schedule of a station couldn't be fetched, after the retries when the error was worth retrying."""
+
+
+class AdaptiveLimiter:
+    """Limit the simultaneous requests to the Zetta API between 1 and maximum, from the latency observed.
+    The limit is halved when a request is slower than target_latency or fails, and grows back by one per limit requests."""
+
+    def __init__(self, maximum, target_latency):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, deadline=None):
+        """Wait for a free request slot. Raise FetchError if deadline (time.monotonic) is reached first."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline-time.monotonic()
+                    if timeout <= 0:
+                        raise FetchError("run deadline reached")
+                self.condition.wait(timeout)
+            self.in_flight += 1
+
+    def release(self, latency, success):
+        with self.condition:
+            self.in_flight -= 1
+            previous_limit = int(self.limit)
+            if not success or latency > self.target_latency:
+                self.limit = max(1.0, self.limit/2)
+            else:
+                self.limit = min(float(self.maximum), self.limit+1/self.limit)
+            if int(self.limit) != previous_limit:
+                logger.debug(f"Simultaneous requests : {int(self.limit)} (latency {latency:.2f} s)")
+            self.condition.notify_all()
+
+
+def create_limiter(config):
+    """Create the limiter of the simultaneous requests, from concurrency and target_latency. Return it."""
+    return AdaptiveLimiter(get_concurrency(config), config.get("target_latency", 2))
+
+def get_deadline(config):
+    """Compute the time.monotonic() at which the run must end, from run_deadline in seconds. Return it or None if there is none."""
+    run_deadline = config.get("run_deadline", 0)
+    if not run_deadline:
+        return None
+    return time.monotonic()+run_deadline
+
+def get_conditional_headers(station_cache):
+    """Build the If-None-Match and If-Modified-Since headers from the validators of the cached schedule.
+    Return them, or None if there is no cached schedule to reuse."""
+    if station_cache is None or not os.path.exists(station_cache["file"]+".schedule.gz"):
+        return None
+    conditional_headers = {}
+    if station_cache.get("etag"):
+        conditional_headers["If-None-Match"] = station_cache["etag"]
+    if station_cache.get("last_modified"):
+        conditional_headers["If-Modified-Since"] = station_cache["last_modified"]
+    return conditional_headers or None
+
+def read_cached_schedule(station_cache):
+    """Read the raw schedule kept in the cache, for a 304 answer. Return it, or None if the cache can't be read."""
+    try:
+        with gzip.open(station_cache["file"]+".schedule.gz", "rb") as file:
+            body = file.read()
+    except (OSError, EOFError):
+        logger.warning(f"The cached schedule {station_cache['file']} can't be read, it is requested again.")
+        return None
+    # The cached schedule is not written again
+    station_cache["not_modified"] = True
+    return body
+
+def store_validators(station_cache, req):
+    """Keep the ETag and Last-Modified of the schedule in the cache, for the next conditional request.
+    A 304 may only send the validators which changed, the others are kept."""
+    if station_cache is None:
+        return
+    if req.status_code == 304:
+        station_cache["etag"] = req.headers.get("ETag", station_cache.get("etag"))
+        station_cache["last_modified"] = req.headers.get("Last-Modified", station_cache.get("last_modified"))
+    else:
+        station_cache["etag"] = req.headers.get("ETag")
+        station_cache["last_modified"] = req.headers.get("Last-Modified")
+
+def iter_body(req, deadline=None):
+    """Yield the body of a streamed request in chunks of up to STREAM_CHUNK_SIZE bytes, as they arrive.
+    A chunk is what could be read at once, so a body sent slowly can't keep the request running long after deadline (time.monotonic).
+    Raise FetchError if the download fails or if the deadline is reached first."""
+    read1 = getattr(req.raw, "read1", None)
+    if read1 is None:
+        # urllib3 older than 2.3 : the chunks are full ones
+        chunks = req.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+    else:
+        chunks = iter(lambda: read1(STREAM_CHUNK_SIZE, decode_content=True), b"")
+    try:
+        for chunk in chunks:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise FetchError("run deadline reached")
+            yield chunk
+    except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+        raise FetchError(f"{type(e).__name__} : {e}") from e
+
+def read_body(req, deadline=None):
+    """Download the whole body of a streamed request. Return it.
+    Raise FetchError if the download fails or if deadline (time.monotonic) is reached first."""
+    try:
+        chunks = list(iter_body(req, deadline))
+    except FetchError:
+        req.close()
+        raise
+    return b"".join(chunks)
+
+def release_streamed_schedule(limiter, req, started, success):
+    """Give back the request slot kept by fetch_schedule for a streamed schedule, once its body is read from started (time.perf_counter).
+    The latency is the time to the headers and to the end of the body."""
+    if limiter is not None:
+        limiter.release(req.elapsed.total_seconds()+time.perf_counter()-started, success)
+
+def fetch_schedule(config, session, split_station, DATE, stream=False, limiter=None, deadline=None, metrics=None, station_cache=None):
+    """Get the schedule of the split station for DATE. Connection errors, timeouts and 5xx are retried up to 'retries' times
+    after a random wait of up to retry_backoff*2^attempt seconds. Return the request once it is a 200, with its body.
+    If station_cache holds a schedule with its validators, the request is conditional and a 304 is returned with the cached schedule as body.
+    If stream is True, the body of a 200 is None, it is not downloaded yet : read it with iter_body.
+    The request slot of limiter is then kept for it, give it back with release_streamed_schedule.
+    Raise FetchError if it fails for good or if deadline (time.monotonic) is reached."""
+    if metrics is None:
+        metrics = RunMetrics()
+    retries = config.get("retries", 3)
+    name = split_station["name"]
+    conditional_headers = get_conditional_headers(station_cache)
+    attempt = 0
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise FetchError("run deadline reached")
+        if limiter is not None:
+            limiter.acquire(deadline)
+        started = time.perf_counter()
+        status_code = 0
+        body = None
+        try:
+            # The body is always streamed, so that a failure while it is downloaded is retried like the others
+            req = request_schedule(config, split_station["uuid"], DATE, session, True, conditional_headers, deadline)
+            status_code = req.status_code
+            if status_code == 200 and not stream:
+                body = read_body(req, deadline)
+        except FetchError as e:
+            error = str(e)
+            is_retryable = True
+        else:
+            if status_code == 304 and conditional_headers:
+                req.close()
+                store_validators(station_cache, req)
+                body = read_cached_schedule(station_cache)
+                if body is not None:
+                    if limiter is not None and not stream:
+                        limiter.release(time.perf_counter()-started, True)
+                    logger.info(f"{status_code} - Not modified, using the cached schedule")
+                    metrics.count("not_modified")
+                    return req, body
+                if limiter is not None:
+                    limiter.release(time.perf_counter()-started, True)
+                conditional_headers = None
+                continue
+            if status_code == 200:
+                if limiter is not None and not stream:
+                    limiter.release(time.perf_counter()-started, True)
+                logger.info(f"{status_code} - Request OK")
+                store_validators(station_cache, req)
+                return req, body
+            error = f"{status_code} - Request NOK"
+            is_retryable = status_code >= 500
+            req.close()
+        latency = time.perf_counter()-started
+        if limiter is not None:
+            limiter.release(latency, False)
+        metrics.add_request(name, DATE, status_code, latency, 0)
+        if not is_retryable or attempt >= retries:
+            raise FetchError(error)
+        delay = get_retry_delay(config, attempt)
+        if deadline is not None and time.monotonic()+delay >= deadline:
+            raise FetchError(f"{error}, no time left to retry before the run deadline")
+        attempt += 1
+        metrics.count("retries")
+        logger.warning(f"{name} - {DATE} : {error}, retry {attempt}/{retries} in {delay:.2f} s")
+        time.sleep(delay)
+
 def check_req_status_code(req):
     """Check the status of the request. Return the status_code"""
     status_code = req.status_code
@@ -156,32 +511,891 @@ def get_response(req):
     else:
         return resp
 
-def get_schedule_of_all_station(config, list_split_station):
-    """Parse the list of split station and get the schedule for each."""
-    schedule_by_station = []
-    for split_station in list_split_station:
-        name = split_station["name"]
-        uuid = split_station["uuid"]
-        logger.info(f"Station find : {name}")
-        req = request_schedule(config, uuid, DATE)
+def get_station_patterns(config):
+    """Compile the patterns of the split stations. 'patterns' gives one or several patterns for each group of split stations,
+    compared separately. If it is not set, 'pattern' is the only group. Return a dictionnary with the compiled patterns of each group."""
+    patterns = config.get("patterns", {DEFAULT_GROUP: config.get("pattern")})
+    station_patterns = {}
+    try:
+        for group, group_patterns in patterns.items():
+            if isinstance(group_patterns, str):
+                group_patterns = [group_patterns]
+            station_patterns[group] = [re.compile(pattern) for pattern in group_patterns]
+    except:
+        logger.exception("The following exception occurred :")
+        sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    return station_patterns
+
+def match_split_stations(stations, station_patterns):
+    """Keep the stations with the role 'station' whose name matches a pattern. A station belongs to the first group it matches.
+    Return the list of split stations with their name, uuid and group."""
+    list_split_station = []
+    for station in stations:
+        if station["role"] != "station":
+            continue
+        for group, patterns in station_patterns.items():
+            if any(pattern.match(station["name"]) for pattern in patterns):
+                list_split_station.append({"name": station["name"], "uuid": station["uuid"], "group": group})
+                break
+    return list_split_station
+
+def get_station_discovery_file(config):
+    """Build the path of the discovery cache, one by server when 'servers' is used. Return it."""
+    if "name" not in config:
+        return STATION_DISCOVERY_FILE
+    return CACHE_DIR+f"stations-{config['name']}.json"
+
+def load_station_discovery(config):
+    """Read the stations found on the server by the last discovery. Return the discovery or None if there is none for this server."""
+    try:
+        with open(get_station_discovery_file(config), encoding="utf-8") as file:
+            discovery = json.load(file)
+    except FileNotFoundError:
+        return None
+    except:
+        logger.warning("The station discovery cache can't be read, it will be replaced.")
+        return None
+    if discovery.get("server") != f"{config['server']}:{config['port']}":
+        return None
+    return discovery
+
+def save_station_discovery(config, discovery):
+    station_discovery_file = get_station_discovery_file(config)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(station_discovery_file+".tmp", "w", encoding="utf-8") as file:
+            json.dump(discovery, file)
+        os.replace(station_discovery_file+".tmp", station_discovery_file)
+    except:
+        # The discovery will only be done again at the next run
+        logger.exception("The following exception occurred :")
+
+def discover_split_stations(config, session=None, known_uuids=()):
+    """Find the split stations on the server. The station list is only requested again when it is older than discovery_ttl
+    seconds or when one of known_uuids is not in it. Return the list of split stations."""
+    ttl = config.get("discovery_ttl", 3600)
+    discovery = load_station_discovery(config)
+    if discovery is None:
+        reason = "no station list in the cache"
+    elif time.time()-discovery["fetched"] > ttl:
+        reason = "the station list is older than discovery_ttl"
+    else:
+        # The uuids missing from the last station list don't trigger a new request until it expires
+        unknown_uuids = set(known_uuids)-set(discovery["uuids"])-set(discovery.get("missing_uuids", []))
+        reason = f"unknown station(s) {', '.join(sorted(unknown_uuids))}" if unknown_uuids else None
+    if reason:
+        logger.info(f"Getting the station list : {reason}")
+        req = request_station_list(config, session)
         if check_req_status_code(req):
             resp = get_response(req)
-            formated_resp = {}
-            name = {'name': split_station["name"]}
-            schedule = {'schedule': resp}
-            formated_resp.update(name)
-            formated_resp.update(schedule)
-        schedule_by_station.append(formated_resp)
-    return schedule_by_station
-     
+            try:
+                stations = [{"name": station["name"], "uuid": station["uuid"], "role": station["role"]} for station in resp["dataObject"]]
+            except:
+                logger.exception("The following exception occurred :")
+                sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+            uuids = [station["uuid"] for station in stations]
+            missing_uuids = sorted(set(known_uuids)-set(uuids))
+            if missing_uuids:
+                logger.warning(f"Station(s) {', '.join(missing_uuids)} not found on the server")
+            discovery = {"server": f"{config['server']}:{config['port']}", "fetched": time.time(),
+                         "uuids": uuids, "missing_uuids": missing_uuids, "stations": stations}
+            save_station_discovery(config, discovery)
+    else:
+        logger.info("Station list from the cache")
+    list_split_station = match_split_stations(discovery["stations"], get_station_patterns(config))
+    for split_station in list_split_station:
+        logger.info(f"Station find : {split_station['name']} - {split_station['uuid']} - {split_station['group']}")
+    return list_split_station
+
+def get_list_split_station(config, session=None):
+    """Get the split stations from the discovery if 'discovery' is set in the config, else from splitStations.json.
+    Return the list of split stations."""
+    if not config.get("discovery", False):
+        return load_list_split_station(LIST_SPLIT_STATIONS_FILE)
+    # A station of splitStations.json unknown to the discovery means the station list changed
+    known_uuids = []
+    if os.path.exists(LIST_SPLIT_STATIONS_FILE):
+        known_uuids = [split_station["uuid"] for split_station in load_list_split_station(LIST_SPLIT_STATIONS_FILE)]
+    return discover_split_stations(config, session, known_uuids)
+
+def get_server_configs(config):
+    """Build the config of each Zetta server. Each entry of 'servers' is laid over the rest of the config and named after 'name' or its server.
+    Without 'servers', the config is the only server. Return the list of server configs."""
+    if "servers" not in config:
+        return [config]
+    common_config = {key: value for key, value in config.items() if key != "servers"}
+    server_configs = []
+    try:
+        for server in config["servers"]:
+            server_config = dict(common_config)
+            # The pattern of a server replaces the patterns of the common config
+            if "pattern" in server and "patterns" not in server:
+                server_config.pop("patterns", None)
+            server_config.update(server)
+            server_config["name"] = str(server.get("name", server["server"]))
+            server_configs.append(server_config)
+        names = [server_config["name"] for server_config in server_configs]
+        if not names or len(set(names)) != len(names):
+            raise ValueError(f"The servers need distinct names : {', '.join(names)}")
+    except:
+        logger.exception("The following exception occurred :")
+        sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    return server_configs
+
+def get_server_name(config):
+    return config.get("name", DEFAULT_SERVER)
+
+def get_list_split_station_of_servers(config, sessions=None, failed_servers=None):
+    """Get the split stations of every server of the config, with the name of their server in 'server'.
+    With 'servers', the stations of each server are found by its discovery, and their name and group are prefixed by the name of the server.
+    The name of a server whose stations couldn't be found is added to failed_servers if it is a list.
+    Return the list of split stations."""
+    if sessions is None:
+        sessions = {}
+    if "servers" not in config:
+        list_split_station = get_list_split_station(config, sessions.get(DEFAULT_SERVER))
+        return [dict(split_station, server=DEFAULT_SERVER) for split_station in list_split_station]
+    list_split_station = []
+    for server_config in get_server_configs(config):
+        name = server_config["name"]
+        try:
+            list_split_station_of_server = discover_split_stations(server_config, sessions.get(name))
+        except SystemExit:
+            # A server out of reach doesn't prevent the check of the others
+            logger.critical(f"The stations of the server {name} couldn't be found, its stations are not checked.")
+            if failed_servers is not None:
+                failed_servers.append(name)
+            continue
+        for split_station in list_split_station_of_server:
+            list_split_station.append(dict(split_station, name=f"{name}/{split_station['name']}",
+                                           group=f"{name}/{get_station_group(split_station)}", server=name))
+    if not list_split_station:
+        logger.error("No station was found on the servers.")
+        sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    return list_split_station
+
+def run_on_servers(config, list_split_station, run_server):
+    """Call run_server(server_config, split stations of the server) for every server at the same time. Return the list of the results."""
+    server_configs = get_server_configs(config)
+    if len(server_configs) == 1:
+        return [run_server(server_configs[0], list_split_station)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(server_configs)) as executor:
+        futures = [executor.submit(run_server, server_config, [split_station for split_station in list_split_station if split_station.get("server") == get_server_name(server_config)])
+                   for server_config in server_configs]
+        return [future.result() for future in futures]
+
+def merge_by_date(results):
+    """Merge the dictionnaries by date and group of several servers. Return the merged dictionnary."""
+    merged = {}
+    for result in results:
+        for DATE, result_of_date in result.items():
+            merged.setdefault(DATE, {}).update(result_of_date)
+    return merged
+
+def get_station_group(split_station):
+    return split_station.get("group", DEFAULT_GROUP)
+
+def get_station_names_by_group(list_split_station):
+    """Sort the names of the split stations by group, in the order of the list. Return a dictionnary with the station names of each group."""
+    station_names_by_group = {}
+    for split_station in list_split_station:
+        station_names_by_group.setdefault(get_station_group(split_station), []).append(split_station["name"])
+    return station_names_by_group
+
+def get_dates_to_check(date_from, date_to):
+    """Build the list of days from date_from to date_to included. Return the list of dates."""
+    if date_to is None:
+        date_to = date_from
+    if date_to < date_from:
+        logger.error(f"The end of the range ({date_to}) is before its beginning ({date_from}).")
+        sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    dates = []
+    date = date_from
+    while date <= date_to:
+        dates.append(date.strftime("%Y-%m-%d"))
+        date = date+datetime.timedelta(days=1)
+    return dates
+
+def get_cache_file(config, uuid, DATE):
+    """Build the path of the cache files of the station identified by uuid on the server for DATE, without extension."""
+    key = f"{config['server']}:{config['port']}|{uuid}|{DATE}"
+    return CACHE_DIR+hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def load_schedule_cache(config, uuid, DATE):
+    """Read the cache of the schedule of the station identified by uuid for DATE.
+    Return the station cache, with no hour if nothing usable is cached."""
+    cache_file = get_cache_file(config, uuid, DATE)
+    station_cache = {"file": cache_file, "hours": {}, "new_hours": {}, "raw": None, "nb_reused": 0, "sha1": None,
+                     "etag": None, "last_modified": None, "not_modified": False}
+    try:
+        with open(cache_file+".json", encoding="utf-8") as file:
+            entry = json.load(file)
+    except FileNotFoundError:
+        logger.debug(f"No cache for {uuid} - {DATE}")
+    except:
+        logger.warning(f"The cache of {uuid} - {DATE} can't be read, it will be replaced.")
+    else:
+        if entry.get("version") == CACHE_VERSION:
+            station_cache["hours"] = entry["hours"]
+            station_cache["sha1"] = entry.get("sha1")
+            station_cache["etag"] = entry.get("etag")
+            station_cache["last_modified"] = entry.get("last_modified")
+    return station_cache
+
+def write_schedule_cache_raw(station_cache, chunk):
+    """Append a chunk of the raw schedule to the cache. Nothing is written if the cached schedule is the one read."""
+    if station_cache.get("not_modified"):
+        return
+    if station_cache["raw"] is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        station_cache["raw"] = gzip.open(station_cache["file"]+".schedule.gz.tmp", "wb")
+    station_cache["raw"].write(chunk)
+
+def discard_schedule_cache_raw(station_cache):
+    """Remove the raw schedule being written to the cache, when it couldn't be read entirely or decoded.
+    A cached schedule which was served for a 304 and can't be decoded is removed too, the next request isn't conditional."""
+    if station_cache["raw"] is not None:
+        station_cache["raw"].close()
+        station_cache["raw"] = None
+        with contextlib.suppress(OSError):
+            os.remove(station_cache["file"]+".schedule.gz.tmp")
+    if station_cache.get("not_modified"):
+        with contextlib.suppress(OSError):
+            os.remove(station_cache["file"]+".schedule.gz")
+
+def iter_chunks_to_cache(station_cache, chunks):
+    """Yield the chunks of the raw schedule after writting them to the cache, and keep the hash of the whole schedule."""
+    schedule_hash = hashlib.sha1()
+    for chunk in chunks:
+        write_schedule_cache_raw(station_cache, chunk)
+        schedule_hash.update(chunk)
+        yield chunk
+    station_cache["sha1"] = schedule_hash.hexdigest()
+
+def reuse_cached_schedule(station_cache, body):
+    """Reuse the spotBlock durations of every hour of the cache if the raw schedule is the one of the last run, without decoding it.
+    Return them, or None if there is no cache or if the schedule changed."""
+    if station_cache is None:
+        return None
+    schedule_hash = hashlib.sha1(body).hexdigest()
+    if not station_cache["hours"] or schedule_hash != station_cache["sha1"]:
+        station_cache["sha1"] = schedule_hash
+        return None
+    logger.debug("The schedule didn't change, using the cache")
+    spotBlock_duration_list = {}
+    for hour, cached_hour in station_cache["hours"].items():
+        merge_spotBlock_duration_list(spotBlock_duration_list, cached_hour["spotBlock_duration_list"])
+    station_cache["new_hours"] = station_cache["hours"]
+    station_cache["nb_reused"] = len(station_cache["hours"])
+    return spotBlock_duration_list
+
+def save_schedule_cache(station_cache, uuid, DATE):
+    """Write the raw schedule, the hash and the spotBlock durations of each hour to the cache."""
+    cache_file = station_cache["file"]
+    entry = {"version": CACHE_VERSION, "uuid": uuid, "date": DATE, "updated": time.time(), "hours": station_cache["new_hours"],
+             "sha1": station_cache["sha1"], "etag": station_cache.get("etag"), "last_modified": station_cache.get("last_modified")}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        if station_cache["raw"] is not None:
+            station_cache["raw"].close()
+            os.replace(cache_file+".schedule.gz.tmp", cache_file+".schedule.gz")
+        with open(cache_file+".json.tmp", "w", encoding="utf-8") as file:
+            json.dump(entry, file)
+        os.replace(cache_file+".json.tmp", cache_file+".json")
+    except:
+        # The cache only saves time, the check can go on without it
+        logger.exception("The following exception occurred :")
+    else:
+        nb_hour = len(station_cache["new_hours"])
+        logger.info(f"{uuid} - {DATE} : {station_cache['nb_reused']}/{nb_hour} hour(s) reused from the cache")
+
+def evict_schedule_cache(config):
+    """Remove the cache files older than cache_max_age_days, then the oldest ones while the cache is bigger than cache_max_size_mb."""
+    max_age = config.get("cache_max_age_days", 7)*86400
+    max_size = config.get("cache_max_size_mb", 200)*1000000
+    if not os.path.isdir(CACHE_DIR):
+        return
+    # Files of the same key are removed together
+    entries = {}
+    for file_name in os.listdir(CACHE_DIR):
+        path = CACHE_DIR+file_name
+        stat = os.stat(path)
+        key = file_name.split(".")[0]
+        entry = entries.setdefault(key, {"paths": [], "size": 0, "mtime": 0})
+        entry["paths"].append(path)
+        entry["size"] = entry["size"]+stat.st_size
+        entry["mtime"] = max(entry["mtime"], stat.st_mtime)
+    now = time.time()
+    total_size = 0
+    kept_entries = []
+    nb_removed = 0
+    for entry in entries.values():
+        if now-entry["mtime"] > max_age:
+            for path in entry["paths"]:
+                os.remove(path)
+            nb_removed += 1
+        else:
+            total_size = total_size+entry["size"]
+            kept_entries.append(entry)
+    kept_entries.sort(key=lambda entry: entry["mtime"])
+    for entry in kept_entries:
+        if total_size <= max_size:
+            break
+        for path in entry["paths"]:
+            os.remove(path)
+        total_size = total_size-entry["size"]
+        nb_removed += 1
+    logger.info(f"Cache : {nb_removed} schedule(s) removed, {len(entries)-nb_removed} kept ({total_size} bytes)")
+
+def get_hourGroup_hash(station_name, hourGroup_text):
+    """Compute the hash of the raw text of the hourGroup, so that an hour which didn't change is not decoded. Return the hash."""
+    return hashlib.sha1(f"{station_name}|{hourGroup_text}".encode("utf-8")).hexdigest()
+
+def analyse_cached_hourGroup(station_name, spotBlock_duration_list, hourGroup_text, hourGroup, station_cache):
+    """Extract the spotBlock durations of an hourGroup decoded by json, given with its raw text.
+    The hourGroup is only decoded if its raw text changed since the last run, the spotBlock durations of the cache are reused otherwise."""
+    hour = str(hourGroup["hour"])
+    hour_hash = get_hourGroup_hash(station_name, hourGroup_text)
+    cached_hour = station_cache["hours"].get(hour)
+    if cached_hour and cached_hour["hash"] == hour_hash:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Heure : {hour} didn't change, using the cache")
+        hour_spotBlock_duration_list = cached_hour["spotBlock_duration_list"]
+        station_cache["nb_reused"] += 1
+    else:
+        hour_spotBlock_duration_list = {}
+        analyse_hourGroup(station_name, hour_spotBlock_duration_list, decode_hourGroup(hourGroup))
+    station_cache["new_hours"][hour] = {"hash": hour_hash, "spotBlock_duration_list": hour_spotBlock_duration_list}
+    merge_spotBlock_duration_list(spotBlock_duration_list, hour_spotBlock_duration_list)
+
+def analyse_raw_hourGroups(station_name, spotBlock_duration_list, raw_hourGroups, station_cache=None, on_hour=None):
+    """Extract the spotBlock durations of the 24 first hourGroups at most, given by iter_raw_hourGroups.
+    If station_cache is given, only the hours which changed since the last run are decoded.
+    If on_hour is set, it is called with the spotBlock durations of each hour as soon as the hour is read.
+    Return the number of hourGroups read."""
+    nb_hourGroup = 0
+    for hourGroup_text, hourGroup in raw_hourGroups:
+        if on_hour is None and station_cache is None:
+            analyse_hourGroup(station_name, spotBlock_duration_list, decode_hourGroup(hourGroup))
+        else:
+            hour_spotBlock_duration_list = {}
+            if station_cache is None:
+                analyse_hourGroup(station_name, hour_spotBlock_duration_list, decode_hourGroup(hourGroup))
+            else:
+                analyse_cached_hourGroup(station_name, hour_spotBlock_duration_list, hourGroup_text, hourGroup, station_cache)
+            merge_spotBlock_duration_list(spotBlock_duration_list, hour_spotBlock_duration_list)
+            if on_hour is not None:
+                on_hour(hour_spotBlock_duration_list)
+        nb_hourGroup += 1
+        if nb_hourGroup == 24:
+            break
+    return nb_hourGroup
+
+def get_schedule_of_station(config, session, split_station, DATE, station_cache=None, metrics=None, limiter=None, deadline=None, archive=None):
+    """Get the raw schedule of one split station, write it to the cache and add it to the archive if they are given.
+    Return the raw schedule. Raise FetchError if the schedule can't be fetched."""
+    if metrics is None:
+        metrics = RunMetrics()
+    name = split_station["name"]
+    logger.info(f"Station find : {name} - {DATE}")
+    req, body = fetch_schedule(config, session, split_station, DATE, False, limiter, deadline, metrics, station_cache)
+    metrics.add_request(name, DATE, req.status_code, req.elapsed.total_seconds(), req.raw.tell())
+    if station_cache is not None:
+        write_schedule_cache_raw(station_cache, body)
+    archive_schedule(archive, split_station, DATE, body)
+    return body
+
+def iter_raw_hourGroups(chunks):
+    """Read the schedule incrementally from the chunks of the body and yield each hourGroup of the hourGroupCollection
+    as soon as it is complete, as its raw text and its json decoding. Yield nothing if there is no hourGroupCollection."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    chunks = iter(chunks)
+    # Look for the beginning of the hourGroupCollection array
+    for chunk in chunks:
+        # Keep only the end of the buffer, the key could be cut between two chunks
+        buffer = buffer[-64:] + text_decoder.decode(chunk)
+        match = HOUR_GROUP_COLLECTION_START.search(buffer)
+        if match:
+            break
+    else:
+        return
+    # The text is kept in parts and only joined to be decoded. A failed decode reads again the hourGroup from its start,
+    # so the next one waits for the buffer to grow by STREAM_CHUNK_SIZE and by its size at the failed decode
+    parts = [buffer[match.end():]]
+    size = len(parts[0])
+    failed_size = 0
+    # None marks the end of the body, what is left is decoded whatever its size
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is not None:
+            text = text_decoder.decode(chunk)
+            parts.append(text)
+            size += len(text)
+            if size < failed_size+max(STREAM_CHUNK_SIZE, failed_size):
+                continue
+        buffer = "".join(parts)
+        position = 0
+        failed_size = 0
+        # Decode each complete hourGroup of the buffer one after the other
+        while True:
+            position = JSON_SEPARATORS.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                hourGroup, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The hourGroup is not complete yet
+                if chunk is None:
+                    raise
+                failed_size = len(buffer)-position
+                break
+            yield buffer[position:end], hourGroup
+            position = end
+        parts = [buffer[position:]]
+        size = len(parts[0])
+    raise ValueError("The hourGroupCollection is not complete.")
+
+def iter_hourGroupCollection(chunks):
+    """Read the schedule incrementally from the chunks of the body and yield each hourGroup
+    of the hourGroupCollection as soon as it is complete, as an HourGroup. Yield nothing if there is no hourGroupCollection."""
+    for hourGroup_text, hourGroup in iter_raw_hourGroups(chunks):
+        yield decode_hourGroup(hourGroup)
+
+def iter_chunks_to_archive(archive_writer, chunks):
+    """Yield the chunks of the raw schedule after writing them to archive_writer.
+    The schedule is not archived if a chunk can't be written, the check goes on without it."""
+    for chunk in chunks:
+        if not archive_writer.closed:
+            try:
+                archive_writer.write(chunk)
+            except OSError:
+                logger.exception("The following exception occurred :")
+                archive_writer.discard()
+        yield chunk
+
+def analyse_schedule_stream(station_name, chunks, station_cache=None, on_hour=None, archive_writer=None):
+    """Read the schedule of a station hour by hour from the chunks of its body, while it is downloaded, and extract the spotBlock durations.
+    If on_hour is set, it is called with the spotBlock durations of each hour as soon as the hour is read.
+    If archive_writer is given, the raw schedule is written to it.
+    Return the spotBlock durations of the station. Raise FetchError if the download fails or if the schedule can't be decoded."""
+    spotBlock_duration_list = {}
+    if station_cache is not None:
+        chunks = iter_chunks_to_cache(station_cache, chunks)
+    if archive_writer is not None:
+        chunks = iter_chunks_to_archive(archive_writer, chunks)
+    try:
+        nb_hourGroup = analyse_raw_hourGroups(station_name, spotBlock_duration_list, iter_raw_hourGroups(chunks), station_cache, on_hour)
+        # The copies of the raw schedule need the end of the body too, the cached one is decoded whole on a 304
+        if station_cache is not None or archive_writer is not None:
+            for chunk in chunks:
+                pass
+    except FetchError:
+        raise
+    except Exception as e:
+        logger.exception("The following exception occurred :")
+        raise FetchError(f"The schedule can't be decoded : {type(e).__name__} : {e}") from e
+    if nb_hourGroup == 0:
+        logger.error("No dataObject. Log is not available.")
+    return spotBlock_duration_list
+
+def analyse_schedule(station_name, hourGroupCollection):
+    """Extract the spotBlock durations of a whole schedule, given as the hourGroups of decode_schedule.
+    Return the spotBlock durations of the station."""
+    spotBlock_duration_list = {}
+    logger.info(f"Station : {station_name}")
+    if hourGroupCollection is None:
+        logger.error("No dataObject. Log is not available.")
+    else:
+        # Loop from 0 to 23 to get each hourGroup
+        loop_into_schedule(station_name, spotBlock_duration_list, hourGroupCollection)
+    return spotBlock_duration_list
+
+def analyse_schedule_body(station_name, body, station_cache=None):
+    """Decode the raw schedule of a station and extract the spotBlock durations.
+    If station_cache is given, only the hours whose raw text changed since the last run are decoded.
+    Return the spotBlock durations of the station."""
+    if station_cache is None:
+        return analyse_schedule(station_name, decode_schedule(body))
+    spotBlock_duration_list = {}
+    logger.info(f"Station : {station_name}")
+    if analyse_raw_hourGroups(station_name, spotBlock_duration_list, iter_raw_hourGroups([body]), station_cache) == 0:
+        logger.error("No dataObject. Log is not available.")
+    return spotBlock_duration_list
+
+def get_analysis_workers(config):
+    """Read the number of processes analysing the schedules in the config, 0 to analyse them in the request threads. Return it."""
+    analysis_workers = config.get("analysis_workers", 0)
+    if not isinstance(analysis_workers, int) or analysis_workers < 0:
+        logger.error(f"analysis_workers must be an integer greater than or equal to 0, not '{analysis_workers}'.")
+        sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    return analysis_workers
+
+def init_analysis_worker(log_files):
+    """Send the logs of an analysis process to the log files of the main process. log_files is a list of (path, level, is_json)."""
+    logger.setLevel(min((level for log_file, level, is_json in log_files), default=logging.INFO))
+    for log_file, level, is_json in log_files:
+        handler_file = logging.FileHandler(log_file, mode="a", encoding="utf-8")
+        handler_file.setFormatter(JsonLinesFormatter() if is_json else logging.Formatter(LOG_FORMAT))
+        handler_file.setLevel(level)
+        logger.addHandler(handler_file)
+
+def get_log_files():
+    """Find the files the logs are written to by the listeners of setup_logging. Return a list of (path, level, is_json)."""
+    log_files = []
+    for handler in logger.handlers:
+        listener = getattr(handler, "listener", None)
+        if listener is None:
+            continue
+        for handler_file in listener.handlers:
+            if isinstance(handler_file, logging.FileHandler):
+                log_files.append((handler_file.baseFilename, handler_file.level, isinstance(handler_file.formatter, JsonLinesFormatter)))
+    return log_files
+
+def create_analysis_pool(config):
+    """Create the pool of processes analysing the schedules if analysis_workers is set. Return the pool or None."""
+    analysis_workers = get_analysis_workers(config)
+    if analysis_workers == 0:
+        return None
+    log_files = get_log_files()
+    logger.info(f"Analysing schedules with {analysis_workers} process(es)")
+    if config.get("streaming", False):
+        logger.warning("streaming is ignored with analysis_workers : the schedules are downloaded whole and decoded in the analysis processes")
+    # spawn rather than fork, the request threads may hold locks when a process starts
+    return concurrent.futures.ProcessPoolExecutor(max_workers=analysis_workers, mp_context=multiprocessing.get_context("spawn"),
+                                                  initializer=init_analysis_worker, initargs=(log_files,))
+
+def analyse_schedule_bytes(station_name, body, cached_hours=None):
+    """Decode the raw schedule of a station and extract the spotBlock durations, in an analysis process.
+    cached_hours are the hours of the station cache, if it is used.
+    Return the spotBlock durations of the station, the new hours of the cache and the number of hours reused from it."""
+    station_cache = None
+    if cached_hours is not None:
+        station_cache = {"hours": cached_hours, "new_hours": {}, "nb_reused": 0}
+    spotBlock_duration_list = analyse_schedule_body(station_name, body, station_cache)
+    if station_cache is None:
+        return spotBlock_duration_list, None, 0
+    return spotBlock_duration_list, station_cache["new_hours"], station_cache["nb_reused"]
+
+def analyse_schedule_in_pool(analysis_pool, station_name, body, station_cache=None):
+    """Send the raw schedule of a station to the analysis processes and wait for its spotBlock durations. Return them.
+    Raise FetchError if the schedule can't be decoded."""
+    cached_hours = None
+    if station_cache is not None:
+        cached_hours = station_cache["hours"]
+    try:
+        spotBlock_duration_list, new_hours, nb_reused = analysis_pool.submit(analyse_schedule_bytes, station_name, body, cached_hours).result()
+    except concurrent.futures.process.BrokenProcessPool:
+        logger.exception("The following exception occurred :")
+        sys.exit(f"An error has occurred, please read the log file '{LOG_FILE_NAME}' for more details.")
+    except Exception as e:
+        logger.exception("The following exception occurred :")
+        raise FetchError(f"The schedule can't be decoded : {type(e).__name__} : {e}") from e
+    if station_cache is not None:
+        station_cache["new_hours"] = new_hours
+        station_cache["nb_reused"] = nb_reused
+    return spotBlock_duration_list
+
+def get_spotBlock_duration_of_station(config, session, split_station, DATE, use_cache=False, metrics=None, analysis_pool=None, limiter=None, deadline=None, on_hour=None, archive=None):
+    """Get the schedule of one split station for DATE and extract the spotBlock durations, in analysis_pool if it is given.
+    If use_cache is True, only the hours which changed since the last run are analysed. If archive is given, the raw schedule is added to it.
+    If on_hour is set, the schedule is streamed and on_hour is called with the spotBlock durations of each hour as soon as it is read.
+    Return the spotBlock durations. Raise FetchError if the schedule can't be fetched."""
+    if metrics is None:
+        metrics = RunMetrics()
+    uuid = split_station["uuid"]
+    station_cache = None
+    if use_cache:
+        station_cache = load_schedule_cache(config, uuid, DATE)
+    try:
+        spotBlock_duration_list = extract_spotBlock_duration_of_station(config, session, split_station, DATE, station_cache, metrics,
+                                                                        analysis_pool, limiter, deadline, on_hour, archive)
+    except FetchError:
+        if station_cache is not None:
+            discard_schedule_cache_raw(station_cache)
+        raise
+    if use_cache:
+        save_schedule_cache(station_cache, uuid, DATE)
+    metrics.count("breaks", sum(len(list_of_etm) for list_of_etm in spotBlock_duration_list.values()))
+    return spotBlock_duration_list
+
+def extract_spotBlock_duration_of_station(config, session, split_station, DATE, station_cache=None, metrics=None, analysis_pool=None, limiter=None, deadline=None, on_hour=None, archive=None):
+    """Fetch the schedule of one split station for DATE and extract the spotBlock durations, in the way chosen by get_spotBlock_duration_of_station.
+    Return the spotBlock durations. Raise FetchError if the schedule can't be fetched or decoded."""
+    name = split_station["name"]
+    if analysis_pool is not None and on_hour is None:
+        # Only the raw body is sent to the analysis process, the schedule is decoded there
+        body = get_schedule_of_station(config, session, split_station, DATE, station_cache, metrics, limiter, deadline, archive)
+        spotBlock_duration_list = reuse_cached_schedule(station_cache, body)
+        if spotBlock_duration_list is None:
+            with metrics.phase("analysis process", time.thread_time):
+                spotBlock_duration_list = analyse_schedule_in_pool(analysis_pool, name, body, station_cache)
+    elif config.get("streaming", False) or on_hour is not None:
+        # Read the schedule hour by hour while it is downloaded.
+        logger.info(f"Station find : {name} - {DATE}")
+        req, body = fetch_schedule(config, session, split_station, DATE, True, limiter, deadline, metrics, station_cache)
+        started = time.perf_counter()
+        # The cached schedule of a 304 is read at once, and not decoded if the hours of the cache are its hours
+        spotBlock_duration_list = None
+        if body is not None:
+            spotBlock_duration_list = reuse_cached_schedule(station_cache, body)
+        if spotBlock_duration_list is not None:
+            release_streamed_schedule(limiter, req, started, True)
+            metrics.add_request(name, DATE, req.status_code, req.elapsed.total_seconds(), req.raw.tell())
+            if on_hour is not None:
+                for cached_hour in station_cache["hours"].values():
+                    on_hour(cached_hour["spotBlock_duration_list"])
+            archive_schedule(archive, split_station, DATE, body)
+            return spotBlock_duration_list
+        chunks = iter_body(req, deadline) if body is None else [body]
+        # Parsing and loop_into_schedule are done together, while the body is downloaded
+        archive_writer = create_archive_writer(archive, split_station, DATE)
+        try:
+            with metrics.phase("parse and loop_into_schedule", time.thread_time):
+                spotBlock_duration_list = analyse_schedule_stream(name, chunks, station_cache, on_hour, archive_writer)
+        except FetchError:
+            release_streamed_schedule(limiter, req, started, False)
+            if archive_writer is not None:
+                archive_writer.discard()
+            raise
+        finally:
+            req.close()
+        release_streamed_schedule(limiter, req, started, True)
+        metrics.add_request(name, DATE, req.status_code, req.elapsed.total_seconds(), req.raw.tell())
+        commit_archive_writer(archive_writer)
+    else:
+        body = get_schedule_of_station(config, session, split_station, DATE, station_cache, metrics, limiter, deadline, archive)
+        spotBlock_duration_list = reuse_cached_schedule(station_cache, body)
+        if spotBlock_duration_list is None and station_cache is not None:
+            # Only the hours which changed are decoded, while they are analysed
+            with metrics.phase("parse and loop_into_schedule", time.thread_time):
+                try:
+                    spotBlock_duration_list = analyse_schedule_body(name, body, station_cache)
+                except Exception as e:
+                    logger.exception("The following exception occurred :")
+                    raise FetchError(f"The schedule can't be decoded : {type(e).__name__} : {e}") from e
+        elif spotBlock_duration_list is None:
+            with metrics.phase("parse", time.thread_time):
+                try:
+                    hourGroupCollection = decode_schedule(body)
+                except Exception as e:
+                    logger.exception("The following exception occurred :")
+                    raise FetchError(f"The schedule can't be decoded : {type(e).__name__} : {e}") from e
+            with metrics.phase("loop_into_schedule", time.thread_time):
+                try:
+                    spotBlock_duration_list = analyse_schedule(name, hourGroupCollection)
+                except Exception as e:
+                    # As in the analysis processes, a schedule which can't be analysed only fails its station
+                    logger.exception("The following exception occurred :")
+                    raise FetchError(f"The schedule can't be analysed : {type(e).__name__} : {e}") from e
+    return spotBlock_duration_list
+
+def get_spotBlock_duration_by_date(config, list_split_station, dates, use_cache=False, session=None, metrics=None, analysis_pool=None, archive=None):
+    """Get and analyse the schedule of every split station for every date, several at a time, on a shared session.
+    If no session is given, a new one is opened and closed at the end. The same goes for the analysis processes if analysis_workers is set.
+    If archive is given, the raw schedules are added to it.
+    The simultaneous requests adapt to the latency of the server, and the stations which can't be fetched before run_deadline
+    are left out of the comparison and listed in the 'failed' of their matrix.
+    Return a dictionnary with, for each date, the matrix of spotBlock durations of each group of split stations."""
+    if metrics is None:
+        metrics = RunMetrics()
+    concurrency = get_concurrency(config)
+    logger.info(f"Getting {len(list_split_station)*len(dates)} schedule(s) with up to {concurrency} simultaneous request(s)")
+    limiter = create_limiter(config)
+    deadline = get_deadline(config)
+    spotBlock_duration_by_date = {}
+    if session is None:
+        session_context = create_session(config)
+    else:
+        session_context = contextlib.nullcontext(session)
+    if analysis_pool is None:
+        analysis_pool_context = create_analysis_pool(config) or contextlib.nullcontext()
+    else:
+        analysis_pool_context = contextlib.nullcontext(analysis_pool)
+    with metrics.phase("fetch"), session_context as session, analysis_pool_context as analysis_pool:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        is_deadline_reached = False
+        try:
+            futures_by_date = {}
+            for DATE in dates:
+                futures_by_date[DATE] = [executor.submit(get_spotBlock_duration_of_station, config, session, split_station, DATE, use_cache, metrics, analysis_pool, limiter, deadline, None, archive) for split_station in list_split_station]
+            # Each group of split stations has its own matrix, the column of a station is its position in its group
+            station_names_by_group = {}
+            columns = []
+            for split_station in list_split_station:
+                station_names = station_names_by_group.setdefault(get_station_group(split_station), [])
+                columns.append(len(station_names))
+                station_names.append(split_station["name"])
+            for DATE, futures in futures_by_date.items():
+                matrices = {group: create_spotBlock_matrix(station_names) for group, station_names in station_names_by_group.items()}
+                for split_station, column, future in zip(list_split_station, columns, futures):
+                    matrix = matrices[get_station_group(split_station)]
+                    try:
+                        timeout = None
+                        if deadline is not None:
+                            timeout = max(0, deadline-time.monotonic())
+                        spotBlock_duration_list = future.result(timeout)
+                    except concurrent.futures.TimeoutError:
+                        is_deadline_reached = True
+                        future.cancel()
+                        error = "run deadline reached"
+                    except FetchError as e:
+                        error = str(e)
+                    else:
+                        add_station_to_matrix(matrix, column, spotBlock_duration_list)
+                        continue
+                    logger.error(f"{split_station['name']} - {DATE} : the schedule couldn't be fetched ({error})")
+                    matrix["failed"].add(split_station["name"])
+                    metrics.add_failure(split_station["name"], DATE, error)
+                spotBlock_duration_by_date[DATE] = matrices
+                metrics.count("etms", sum(len(matrix["etms"]) for matrix in matrices.values()))
+        finally:
+            # After the deadline, the requests still running are not waited for
+            executor.shutdown(wait=not is_deadline_reached, cancel_futures=True)
+    return spotBlock_duration_by_date
+
+def get_spotBlock_duration_of_servers(config, list_split_station, dates, use_cache=False, sessions=None, metrics=None, analysis_pool=None, archive=None):
+    """Get and analyse the schedules of every server at the same time, each server with its own config, session and limiter.
+    sessions is a dictionnary of the session of each server, a new one is opened for a server which has none.
+    Return a dictionnary with, for each date, the matrix of spotBlock durations of each group of split stations of every server."""
+    if sessions is None:
+        sessions = {}
+    if analysis_pool is None:
+        analysis_pool_context = create_analysis_pool(config) or contextlib.nullcontext()
+    else:
+        analysis_pool_context = contextlib.nullcontext(analysis_pool)
+    # The analysis processes are shared by the servers
+    with analysis_pool_context as analysis_pool:
+        results = run_on_servers(config, list_split_station, lambda server_config, list_split_station_of_server: get_spotBlock_duration_by_date(
+            server_config, list_split_station_of_server, dates, use_cache, sessions.get(get_server_name(server_config)), metrics, analysis_pool, archive))
+    return merge_by_date(results)
+
+def get_spotBlock_violations_pipelined(config, list_split_station, dates, use_cache=False, session=None, metrics=None, on_violation=None, archive=None):
+    """Fetch, extract and compare the schedules as connected stages : the schedules are streamed hour by hour by the request threads,
+    and each ETM of a group is compared as soon as every station of the group reported it or has been read entirely.
+    on_violation(DATE, group, etm, error_msg) is called for each violation as soon as it is found.
+    Return the matrices of each date, as get_spotBlock_duration_by_date, and the violations of each date by (group, ETM)."""
+    if metrics is None:
+        metrics = RunMetrics()
+    concurrency = get_concurrency(config)
+    logger.info(f"Getting {len(list_split_station)*len(dates)} schedule(s) with up to {concurrency} simultaneous request(s), comparing each ETM as soon as it is complete")
+    limiter = create_limiter(config)
+    deadline = get_deadline(config)
+    started = time.perf_counter()
+    events = queue.SimpleQueue()
+    station_names_by_group = get_station_names_by_group(list_split_station)
+    spotBlock_duration_by_date = {}
+    violations_by_date = {}
+    # For each matrix, the columns which reported each ETM, the columns read entirely and the ETMs already compared
+    progress_by_date = {}
+    for DATE in dates:
+        spotBlock_duration_by_date[DATE] = {group: create_spotBlock_matrix(station_names) for group, station_names in station_names_by_group.items()}
+        violations_by_date[DATE] = {}
+        progress_by_date[DATE] = {group: {"reported": {}, "ended": set(), "compared": set()} for group in station_names_by_group}
+
+    def run_station(split_station, DATE):
+        on_hour = lambda hour_spotBlock_duration_list: events.put(("hour", DATE, split_station, hour_spotBlock_duration_list))
+        try:
+            get_spotBlock_duration_of_station(config, session, split_station, DATE, use_cache, metrics, None, limiter, deadline, on_hour, archive)
+        except FetchError as e:
+            events.put(("failed", DATE, split_station, str(e)))
+        except BaseException as e:
+            events.put(("crashed", DATE, split_station, e))
+        else:
+            events.put(("ended", DATE, split_station, None))
+
+    is_first_comparison = True
+
+    def compare_etms(DATE, group, etms):
+        nonlocal is_first_comparison
+        matrix = spotBlock_duration_by_date[DATE][group]
+        progress = progress_by_date[DATE][group]
+        nb_station = len(matrix["stations"])
+        for etm in etms:
+            if etm in progress["compared"] or len(progress["reported"][etm] | progress["ended"]) < nb_station:
+                continue
+            progress["compared"].add(etm)
+            if is_first_comparison:
+                is_first_comparison = False
+                metrics.add_phase("time_to_first_comparison", time.perf_counter()-started, 0)
+            error_msg = get_etm_violation(config, matrix, compute_etm_stretch(matrix, matrix["rows"][etm]))
+            if error_msg:
+                if len(station_names_by_group) > 1:
+                    error_msg = f"{group} - {error_msg}"
+                violations_by_date[DATE][(group, etm)] = error_msg
+                metrics.count("violations")
+                if on_violation is not None:
+                    on_violation(DATE, group, etm, error_msg)
+
+    def end_station(DATE, split_station, error=None):
+        """Mark the station as read entirely, or as failed if there is an error, and compare the ETMs which were only waiting for it."""
+        del running[(DATE, split_station["name"])]
+        group = get_station_group(split_station)
+        matrix = spotBlock_duration_by_date[DATE][group]
+        progress = progress_by_date[DATE][group]
+        if error is not None:
+            logger.error(f"{split_station['name']} - {DATE} : the schedule couldn't be fetched ({error})")
+            matrix["failed"].add(split_station["name"])
+            metrics.add_failure(split_station["name"], DATE, error)
+        progress["ended"].add(matrix["stations"].index(split_station["name"]))
+        compare_etms(DATE, group, list(progress["reported"]))
+
+    if session is None:
+        session_context = create_session(config)
+    else:
+        session_context = contextlib.nullcontext(session)
+    with metrics.phase("fetch"), session_context as session:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        running = {}
+        is_deadline_reached = False
+        for DATE in dates:
+            for split_station in list_split_station:
+                running[(DATE, split_station["name"])] = split_station
+                executor.submit(run_station, split_station, DATE)
+        try:
+            while running:
+                try:
+                    timeout = None
+                    if deadline is not None:
+                        timeout = max(0, deadline-time.monotonic())
+                    kind, DATE, split_station, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    # The schedules still read after the deadline are abandoned, the ETMs waiting for them are compared without them
+                    is_deadline_reached = True
+                    for (DATE, name), split_station in list(running.items()):
+                        end_station(DATE, split_station, "run deadline reached")
+                    break
+                if (DATE, split_station["name"]) not in running:
+                    continue
+                if kind == "hour":
+                    group = get_station_group(split_station)
+                    matrix = spotBlock_duration_by_date[DATE][group]
+                    column = matrix["stations"].index(split_station["name"])
+                    add_station_to_matrix(matrix, column, value)
+                    for etm in value:
+                        progress_by_date[DATE][group]["reported"].setdefault(etm, set()).add(column)
+                    compare_etms(DATE, group, value)
+                elif kind == "crashed":
+                    raise value
+                else:
+                    end_station(DATE, split_station, value)
+        finally:
+            # After the deadline, the requests still running are not waited for
+            executor.shutdown(wait=not is_deadline_reached and not running, cancel_futures=True)
+    for DATE in dates:
+        metrics.count("etms", sum(len(matrix["etms"]) for matrix in spotBlock_duration_by_date[DATE].values()))
+    return spotBlock_duration_by_date, violations_by_date
+
 def get_logEventCollection(hour, hourGroup):
     """Get the logEventCollection if exist. Return it or nothing if doesn't exist."""
-    try:
-        logEventCollection = hourGroup["logEventCollection"]
-    except KeyError:
+    logEventCollection = hourGroup.events
+    if logEventCollection is None:
         logger.info(f"No log for {hour} hour")
     else:
-        logger.info(f"Log exists for {hour} hour")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Log exists for {hour} hour")
         return logEventCollection
 
 def is_logEventCollection_even(logEventCollection):
@@ -192,37 +1406,29 @@ def is_logEventCollection_even(logEventCollection):
         logger.exception("The following exception occurred :")
     else:
         if (length % 2 == 0):
-            logger.debug(f"logEventCollection is even.")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("logEventCollection is even.")
             return True
         else:
             # Ajouter un envoie de mail en cas d'erreur
-            logger.error(f"logEventCollection is not even. ETM and SpotBlock number are not egal.")
+            logger.error("logEventCollection is not even. ETM and SpotBlock number are not egal.")
             return False
 
 def get_etm_time(hour, event):
-    try:
-        time = event["exactTimeMarkerEvent"]["time"]
-    except KeyError:
+    time = event.time
+    if time is None:
         time = "00:00:00"
-    except:
-        logger.exception("The following exception occurred :")
-    finally:
-        etm_time = str(hour)+time[2:-3]
+    etm_time = str(hour)+time[2:-3]
+    if logger.isEnabledFor(logging.DEBUG):
         logger.debug(etm_time)
-        return etm_time
+    return etm_time
 
 def get_spotBlock_duration(event):
-    """Add the 'duration' of each element in logEventCollection of the spotBlock. Return the spotBlock duration. """
-    spotBlock_duration = datetime.datetime.strptime("00:00:00.00000",'%H:%M:%S.%f')
-    event_logEventCollection = event["spotBlockEvent"]["logEventCollection"]
-    for element in event_logEventCollection:
-        duration_str = element["assetEvent"]["effectiveTransitions"]["duration"][:15]
-        element_duration = datetime.datetime.strptime(duration_str, '%H:%M:%S.%f')
-        spotBlock_duration = spotBlock_duration+datetime.timedelta(hours=element_duration.hour, minutes=element_duration.minute, seconds=element_duration.second, microseconds=element_duration.microsecond)
-    spotBlock_duration = spotBlock_duration.time()
-    spotBlock_duration_ms = str((spotBlock_duration.hour*360000000)+(spotBlock_duration.minute*60000000)+(spotBlock_duration.second*1000000)+spotBlock_duration.microsecond)[:-3]
-    logger.debug(f"Spotblock duration : {spotBlock_duration_ms}")
-    return spotBlock_duration_ms
+    """Get the duration of the spotBlock, the sum of the 'duration' of its assets added by the decoder. Return it in microseconds."""
+    spotBlock_duration_us = event.duration
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Spotblock duration : {spotBlock_duration_us}")
+    return spotBlock_duration_us
 
 def exists_etm_in_list(spotBlock_duration_list, etm_time):
     try:
@@ -231,31 +1437,80 @@ def exists_etm_in_list(spotBlock_duration_list, etm_time):
         logger.exception("The following exception occurred :")
     else:
         if list_of_etm:
-            logger.debug(f"{etm_time} already exists")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{etm_time} already exists")
         else:
-            logger.debug(f"{etm_time} doesn't exist")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{etm_time} doesn't exist")
             spotBlock_duration_list.update({etm_time: []})
 
+def get_unique_etm_time(spotBlock_duration_list, etm_time):
+    """Number the ETMs found several times at the same minute on a station, so that each of their spotBlocks is compared.
+    Return etm_time for the first one, then etm_time#2, etm_time#3..."""
+    unique_etm_time = etm_time
+    occurrence = 1
+    while spotBlock_duration_list.get(unique_etm_time):
+        occurrence += 1
+        unique_etm_time = f"{etm_time}#{occurrence}"
+    return unique_etm_time
+
 def put_spotBlock_duration(spotBlock_duration_list, etm_time, infos_to_append):
     list_of_etm = spotBlock_duration_list.get(etm_time)
     list_of_etm.append(infos_to_append)
-    logger.debug(f"{infos_to_append} puts in list_of_etm")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{infos_to_append} puts in list_of_etm")
+
+def merge_spotBlock_duration_list(spotBlock_duration_list, spotBlock_duration_list_to_merge):
+    """Add the spotBlock durations of spotBlock_duration_list_to_merge at the end of spotBlock_duration_list."""
+    for etm_time, list_of_etm in spotBlock_duration_list_to_merge.items():
+        exists_etm_in_list(spotBlock_duration_list, etm_time)
+        for infos_to_append in list_of_etm:
+            put_spotBlock_duration(spotBlock_duration_list, etm_time, infos_to_append)
+
+def create_spotBlock_matrix(station_names):
+    """Create an empty matrix of spotBlock durations with one row by ETM and one column by station.
+    The durations are stored row after row in a single array, MISSING_DURATION marks an ETM missing on a station.
+    The stations whose schedule couldn't be fetched are in the set 'failed'. Return the matrix."""
+    return {"stations": list(station_names), "etms": [], "rows": {}, "durations": array.array("q"), "failed": set()}
+
+def get_matrix_row(matrix, etm_time):
+    """Get the row of the ETM in the matrix, adding an empty row if the ETM is new. Return the row number."""
+    row = matrix["rows"].get(etm_time)
+    if row is None:
+        row = len(matrix["etms"])
+        matrix["rows"][etm_time] = row
+        matrix["etms"].append(etm_time)
+        matrix["durations"].extend([MISSING_DURATION]*len(matrix["stations"]))
+    return row
+
+def add_station_to_matrix(matrix, column, spotBlock_duration_list):
+    """Put the spotBlock durations of the station of the column in the matrix."""
+    nb_station = len(matrix["stations"])
+    # get_unique_etm_time gives its own ETM to each spotBlock, an ETM has one spotBlock at most
+    for etm_time, list_of_etm in spotBlock_duration_list.items():
+        row = get_matrix_row(matrix, etm_time)
+        if list_of_etm:
+            matrix["durations"][row*nb_station+column] = list_of_etm[0]["duration"]
 
 def check_logEvent_type(station_name, spotBlock_duration_list, hour, logEventCollection):
+    # Checked once for the hour, this loop runs for every event
+    is_debug = logger.isEnabledFor(logging.DEBUG)
     etm_indic = 0
     for event in logEventCollection:
-        event_type = event["type"]
+        event_type = event.type
         if (event_type == "exactTimeMarker"):
             if (etm_indic == 0):
-                logger.debug("The event before this SpotBlock was an SpotBlock")
-                etm_time = get_etm_time(hour, event)
+                if is_debug:
+                    logger.debug("The event before this SpotBlock was an SpotBlock")
+                etm_time = get_unique_etm_time(spotBlock_duration_list, get_etm_time(hour, event))
                 exists_etm_in_list(spotBlock_duration_list, etm_time)
                 etm_indic = 1
             else:
                 logger.error("The event before this SpotBlock WAS NOT an SpotBlock !")
         if (event_type == "spotBlock"):
             if (etm_indic == 1):
-                logger.debug("The event before this SpotBlock was an ETM")
+                if is_debug:
+                    logger.debug("The event before this SpotBlock was an ETM")
                 spotBlock_duration = get_spotBlock_duration(event)
                 infos_to_append = {"station" :station_name, "duration": spotBlock_duration}
                 put_spotBlock_duration(spotBlock_duration_list, etm_time, infos_to_append)
@@ -263,108 +1518,501 @@ def check_logEvent_type(station_name, spotBlock_duration_list, hour, logEventCol
             else:
                 logger.error("The event before this SpotBlock WAS NOT an ETM !")
 
-def get_hourGroupCollection(schedule):
-    try:
-        #Get the dataObjcet of the schedule
-        dataObject = schedule["dataObject"]
-    except KeyError:
-        logger.error("No dataObject. Log is not available.")
-        hourGroupCollection = False
-        return hourGroupCollection
-    else:
-        #Get the hourGroupCollection of the dataObject
-        hourGroupCollection = dataObject["hourGroupCollection"]
-        return hourGroupCollection
+def analyse_hourGroup(station_name, spotBlock_duration_list, hourGroup):
+    # Get the hour we are working on
+    hour = hourGroup.hour
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Heure : {hour}")
+    # Get the logEventCollection for this hour
+    logEventCollection = get_logEventCollection(hour, hourGroup)
+    # If logEventCollection exists, do some stuff
+    if logEventCollection:
+        #Check if logEventCollention is even, supposing ETM and Spotblock are in equal number
+        if is_logEventCollection_even(logEventCollection):
+            check_logEvent_type(station_name, spotBlock_duration_list, hour, logEventCollection)
 
 def loop_into_schedule(station_name, spotBlock_duration_list, hourGroupCollection):
-    # Loop from 0 to 23 to get each hourGroup
-        i = 0
-        while (i < 24):
-            hourGroup = hourGroupCollection[i]
-            i += 1
-            # Get the hour we are working on
-            hour = hourGroup["hour"]
-            logger.debug(f"Heure : {hour}")
-            # Get the logEventCollection for this hour
-            logEventCollection = get_logEventCollection(hour, hourGroup)
-            # If logEventCollection exists, do some stuff
-            if logEventCollection:
-                #Check if logEventCollention is even, supposing ETM and Spotblock are in equal number
-                if is_logEventCollection_even(logEventCollection):
-                    check_logEvent_type(station_name, spotBlock_duration_list, hour, logEventCollection)
-
-def is_delta_upper_10_percent(etm, list_for_an_etm, max_stretch, error_msg):
-    try:
-        max_duration = int(max(list_for_an_etm))
-        min_duration = int(min(list_for_an_etm))
-        delta = abs(max_duration - min_duration)
-        delta_percent = abs((delta / max_duration)*100)
-    except:
-        logger.exception("The following exception occurred :")
-        return False
-    else:
-        logger.debug(f"Min : {min_duration}")
-        logger.debug(f"Max : {max_duration}")
-        logger.debug(f"Delta : {delta}")
-        logger.debug(f"Delta % : {delta_percent}")
-        if (delta_percent < max_stretch):
+    # Loop over the 24 first hourGroups at most, as the streaming path, a day may have less of them
+        for hourGroup in hourGroupCollection[:24]:
+            analyse_hourGroup(station_name, spotBlock_duration_list, hourGroup)
+
+def compute_etm_stretch(matrix, row):
+    """Compute the min, max and delta of the spotBlock durations of the ETM of the row.
+    Return the stretch of the ETM, with the station the furthest from the median and the stations missing the ETM."""
+    stations = matrix["stations"]
+    nb_station = len(stations)
+    durations_of_etm = matrix["durations"][row*nb_station:(row+1)*nb_station]
+    present_columns = [column for column, duration in enumerate(durations_of_etm) if duration != MISSING_DURATION]
+    missing = []
+    if len(present_columns) < nb_station:
+        failed = matrix["failed"]
+        missing = [station for station, duration in zip(stations, durations_of_etm) if duration == MISSING_DURATION and station not in failed]
+    stretch = {"etm": matrix["etms"][row], "min": None, "max": None, "delta": 0, "delta_percent": 0.0, "outlier": None, "missing": missing}
+    if present_columns:
+        # A single sort gives the min, the max and the median
+        present = sorted(durations_of_etm[column] for column in present_columns)
+        min_duration = present[0]
+        max_duration = present[-1]
+        delta = max_duration-min_duration
+        median = present[len(present)//2]
+        outlier_column = max(present_columns, key=lambda column: abs(durations_of_etm[column]-median))
+        stretch.update({"min": min_duration, "max": max_duration, "delta": delta, "outlier": stations[outlier_column]})
+        if max_duration:
+            stretch["delta_percent"] = (delta/max_duration)*100
+    return stretch
+
+def compute_spotBlock_stretch(matrix):
+    """Compute the stretch of every ETM of the matrix, row by row. Return a list with the stretch of each ETM."""
+    return [compute_etm_stretch(matrix, row) for row in range(len(matrix["etms"]))]
+
+def compute_stretches_by_date(spotBlock_duration_by_date):
+    """Compute the stretch of every ETM of every matrix once, for the history, the comparison and the summary of the servers.
+    Return a dictionnary with, for each date, the list of the stretches of each group."""
+    return {DATE: {group: compute_spotBlock_stretch(matrix) for group, matrix in matrices.items()}
+            for DATE, matrices in spotBlock_duration_by_date.items()}
+
+def is_delta_upper_10_percent(stretch, max_stretch, error_msg):
+    etm = stretch["etm"]
+    is_debug = logger.isEnabledFor(logging.DEBUG)
+    if is_debug:
+        logger.debug(f"Min : {stretch['min']}")
+        logger.debug(f"Max : {stretch['max']}")
+        logger.debug(f"Delta : {stretch['delta']}")
+        logger.debug(f"Delta % : {stretch['delta_percent']}")
+    if (stretch["delta_percent"] < max_stretch):
+        if is_debug:
             logger.debug("Everything is OK !")
-            is_error = 0
-        else: 
-            logger.critical(f"Delta is bigger than {max_stretch} % for {etm} ! Please do something to avoid dead air")
-            error_msg = error_msg + f"Delta is bigger than {max_stretch} % for {etm} ! Please do something to avoid dead air\n"
-            is_error = 1
+        is_error = 0
+    else: 
+        logger.critical(f"Delta is bigger than {max_stretch} % for {etm} ({stretch['outlier']} is the furthest from the others) ! Please do something to avoid dead air")
+        error_msg = error_msg + f"Delta is bigger than {max_stretch} % for {etm} ({stretch['outlier']} is the furthest from the others) ! Please do something to avoid dead air\n"
+        is_error = 1
     return is_error, error_msg
 
-def compare_spotBlock_duration(config, spotBlock_duration_list, error_msg=""):
-    error = 0
-    max_stretch = config["max_stretch"]
-    logger.info(f"Starting the comparison")
-    for etm in spotBlock_duration_list:
-        list_for_an_etm = []
-        logger.info(f'ETM Found : {etm}')
-        list_duration = spotBlock_duration_list[etm]
-        for station_duration in list_duration:
-            logger.debug(f"Station : {station_duration['station']}, duration : {station_duration['duration']}")
-            list_for_an_etm.append(station_duration['duration'])
-        is_error, error_msg = is_delta_upper_10_percent(etm, list_for_an_etm, max_stretch, error_msg)
-        error = error + is_error
+def get_spotBlock_violations(config, matrix, stretches=None):
+    """Find the ETMs whose spotBlock durations are stretched more than max_stretch between the stations.
+    stretches are the ones of compute_spotBlock_stretch, they are computed if they are not given.
+    Return a dictionnary with the error message of each of these ETMs."""
+    logger.info("Starting the comparison")
+    if stretches is None:
+        stretches = compute_spotBlock_stretch(matrix)
+    violations = {}
+    for stretch in stretches:
+        error_msg = get_etm_violation(config, matrix, stretch)
+        if error_msg:
+            violations[stretch["etm"]] = error_msg
+    return violations
+
+def get_etm_violation(config, matrix, stretch):
+    """Check the stretch of an ETM of the matrix against max_stretch. Return the error message, or None if the ETM is OK."""
+    stations = matrix["stations"]
+    etm = stretch["etm"]
+    logger.info(f'ETM Found : {etm}')
+    if logger.isEnabledFor(logging.DEBUG):
+        row = matrix["rows"][etm]
+        for column, station in enumerate(stations):
+            logger.debug(f"Station : {station}, duration : {matrix['durations'][row*len(stations)+column]}")
+    if stretch["missing"]:
+        logger.warning(f"{etm} is missing on : {', '.join(stretch['missing'])}")
+    if stretch["max"] is None:
+        return None
+    is_error, error_msg = is_delta_upper_10_percent(stretch, config["max_stretch"], "")
+    if is_error:
+        return error_msg
+    return None
+
+def get_spotBlock_violations_of_groups(config, matrices, stretches_of_groups=None):
+    """Find the violations of every group of split stations. The group is added to the error message when there are several.
+    stretches_of_groups are the stretches of each group, if they are already computed.
+    Return a dictionnary with the error message of each (group, ETM)."""
+    if stretches_of_groups is None:
+        stretches_of_groups = {}
+    violations = {}
+    for group, matrix in matrices.items():
+        if len(matrices) > 1:
+            logger.info(f"Group : {group}")
+        for etm, error_msg in get_spotBlock_violations(config, matrix, stretches_of_groups.get(group)).items():
+            if len(matrices) > 1:
+                error_msg = f"{group} - {error_msg}"
+            violations[(group, etm)] = error_msg
+    return violations
+
+def get_available_matrices(DATE, matrices):
+    """Keep the groups of split stations whose log was found for DATE, the others are reported.
+    Return a dictionnary with the matrix of each of these groups."""
+    available_matrices = {}
+    for group, matrix in matrices.items():
+        if not matrix["etms"]:
+            logger.critical(f"Log was not available for a least one station of {group}. Please check if log is present in Zetta for {DATE}.")
+            print(f"Log was not available for a least one station of {group}. Please check if log is present in Zetta for {DATE}.")
+        else:
+            available_matrices[group] = matrix
+    return available_matrices
+
+def compare_spotBlock_duration(config, DATE, matrices, alerts, metrics=None, stretches_of_groups=None):
+    """Find the violations of DATE and send them to alerts. Return True if there is none."""
+    if metrics is None:
+        metrics = RunMetrics()
+    with metrics.phase("compare_spotBlock_duration"):
+        violations = get_spotBlock_violations_of_groups(config, matrices, stretches_of_groups)
+    error = len(violations)
+    metrics.count("violations", error)
     if (error == 0):
         return True
     else:
         logger.info(f"Error : {error}")
-        sendMail(error, error_msg)
+        list_alert = [(get_alert_key(DATE, etm, matrices[group]["stations"]), error_msg) for (group, etm), error_msg in violations.items()]
+        alerts.send(f'ZettaSpotBlockChecker - {error} error(s) found !', list_alert, f"Date : {DATE}\n")
         return False
 
-if __name__ == '__main__':
-    logger.info("------")
-    logger.info("STARTUP")
-    logger.info(f"Date to check : {DATE}")
-    print(f"Date to check : {DATE}")
-    # Read config file
-    config = load_config(CONFIG_FILE)
-    # Read station list
-    list_split_station = load_list_split_station(LIST_SPLIT_STATIONS_FILE)
-    # Get schedule by station and put it in a dictionnary.
-    schedule_by_station = get_schedule_of_all_station(config, list_split_station)
-    spotBlock_duration_list = {}
-    for a in schedule_by_station:
-        station_name = a["name"]
-        logger.info(f"Station : {station_name}")
-        schedule = a["schedule"]
-        hourGroupCollection = get_hourGroupCollection(schedule)
-        if (hourGroupCollection == False):
-            pass
-        else:
-            # Loop from 0 to 23 to get each hourGroup
-            loop_into_schedule(station_name, spotBlock_duration_list, hourGroupCollection)
-    if (spotBlock_duration_list == {}):
-        logger.critical(f"Log was not available for a least one station. Please check if log is present in Zetta for {DATE}.")
-        print(f"Log was not available for a least one station. Please check if log is present in Zetta for {DATE}.")
+def report_failed_stations(DATE, matrices, alerts):
+    """Log and send by mail the split stations whose schedule couldn't be fetched for DATE. Return True if there is none."""
+    failed_stations = [station for matrix in matrices.values() for station in matrix["stations"] if station in matrix["failed"]]
+    if not failed_stations:
+        return True
+    logger.error(f"Station(s) not checked : {', '.join(failed_stations)}")
+    print(f"Station(s) not checked : {', '.join(failed_stations)}")
+    list_alert = [((DATE, "not checked", station), f"{station}\n") for station in failed_stations]
+    alerts.send(f'ZettaSpotBlockChecker - {len(failed_stations)} station(s) not checked !', list_alert,
+                f"Date : {DATE}\nThe schedule of the following station(s) couldn't be fetched, they were not checked :\n")
+    return False
+
+def check_spotBlock_duration(config, DATE, matrices, alerts, metrics=None, violations=None, stretches_of_groups=None):
+    """Compare the spotBlock durations of each group of split stations for DATE and report the result.
+    If the violations of DATE are given, they were already compared and sent, only the result is reported.
+    stretches_of_groups are the stretches of each group, if they are already computed.
+    Return True if no error was found and every station was checked."""
+    logger.info(f"Date checked : {DATE}")
+    print(f"Date checked : {DATE}")
+    is_complete = report_failed_stations(DATE, matrices, alerts)
+    # A group without log, on a server which is down for example, doesn't prevent the check of the others
+    available_matrices = get_available_matrices(DATE, matrices)
+    if len(available_matrices) < len(matrices):
+        is_complete = False
+    if not available_matrices:
+        return False
     else: 
-        if compare_spotBlock_duration(config, spotBlock_duration_list):
+        if violations is None:
+            is_ok = compare_spotBlock_duration(config, DATE, available_matrices, alerts, metrics, stretches_of_groups)
+        else:
+            is_ok = not violations
+        if is_ok and is_complete:
             logger.info("No error found, everything is OK.")
             print("No error found, everything is OK.")
+            return True
         else:
             logger.error("ERROR FOUND !")
-            print("ERROR FOUND !")  
+            print("ERROR FOUND !")
+            return False
+
+def get_watched_dates(config):
+    """Build the list of days watched : today and the next watch_days day(s). Return the list of dates."""
+    today = datetime.date.today()
+    return get_dates_to_check(today, today+datetime.timedelta(days=config.get("watch_days", 0)))
+
+def report_violation_changes(known_violations, violations, dates, alerts, station_names_by_group):
+    """Log and send by mail the violations which are new or resolved since the previous check of the dates.
+    A resolved violation is sent again as soon as it happens again."""
+    new_violations = {key: violations[key] for key in violations if key not in known_violations}
+    resolved_violations = {key: known_violations[key] for key in known_violations if key not in violations and key[0] in dates}
+    if not new_violations and not resolved_violations:
+        logger.info(f"No change since the previous check, {len(violations)} error(s) still found.")
+        return
+    logger.info(f"{len(new_violations)} new error(s), {len(resolved_violations)} resolved error(s)")
+    print(f"{len(new_violations)} new error(s), {len(resolved_violations)} resolved error(s)")
+    # The new and resolved errors are queued together, they are sent in the same digest
+    if new_violations:
+        list_alert = [(get_alert_key(DATE, etm, station_names_by_group.get(group, [])), error_msg) for (DATE, group, etm), error_msg in new_violations.items()]
+        alerts.send(f'ZettaSpotBlockChecker - {len(new_violations)} new error(s) !', list_alert, "New error(s) :\n")
+    if resolved_violations:
+        alerts.forget([get_alert_key(DATE, etm, station_names_by_group.get(group, [])) for (DATE, group, etm) in resolved_violations])
+        alerts.send(f'ZettaSpotBlockChecker - {len(resolved_violations)} resolved error(s) !',
+                    [(None, error_msg) for error_msg in resolved_violations.values()], "Resolved error(s) :\n")
+
+def report_failed_servers(failed_servers, alerts):
+    """Log and send by mail the servers whose stations couldn't be found. Return True if there is none."""
+    if not failed_servers:
+        return True
+    logger.error(f"Server(s) not checked : {', '.join(failed_servers)}")
+    print(f"Server(s) not checked : {', '.join(failed_servers)}")
+    # Not sent again within alert_window while the server stays out of reach
+    list_alert = [(("server not checked", name), f"{name}\n") for name in failed_servers]
+    alerts.send(f'ZettaSpotBlockChecker - {len(failed_servers)} server(s) not checked !', list_alert,
+                "The stations of the following server(s) couldn't be found, they were not checked :\n")
+    return False
+
+def report_servers(config, list_split_station, spotBlock_duration_by_date, metrics=None, failed_servers=(), stretches_by_date=None):
+    """Log and print the result of each server over the dates checked, and add it to the metrics.
+    The servers of failed_servers, whose stations couldn't be found, are reported as failed.
+    stretches_by_date are the ones of compute_stretches_by_date, they are computed if they are not given."""
+    if metrics is None:
+        metrics = RunMetrics()
+    if stretches_by_date is None:
+        stretches_by_date = compute_stretches_by_date(spotBlock_duration_by_date)
+    server_by_group = {get_station_group(split_station): split_station["server"] for split_station in list_split_station}
+    results = {get_server_name(server_config): {"stations": 0, "etms": 0, "errors": 0, "not_checked": 0, "failed": 0} for server_config in get_server_configs(config)}
+    for name in failed_servers:
+        results[name]["failed"] = 1
+    for split_station in list_split_station:
+        results[split_station["server"]]["stations"] += 1
+    for DATE, matrices in spotBlock_duration_by_date.items():
+        for group, matrix in matrices.items():
+            result = results[server_by_group[group]]
+            result["etms"] += len(matrix["etms"])
+            result["not_checked"] += len(matrix["failed"])
+            result["errors"] += sum(1 for stretch in stretches_by_date[DATE][group] if stretch["max"] is not None and stretch["delta_percent"] >= config["max_stretch"])
+    for name, result in results.items():
+        if result["failed"]:
+            logger.error(f"Server {name} : FAILED, its stations couldn't be found and were not checked")
+            print(f"Server {name} : FAILED, its stations couldn't be found and were not checked")
+        else:
+            logger.info(f"Server {name} : {result['stations']} station(s), {result['etms']} ETM(s), {result['errors']} error(s), {result['not_checked']} schedule(s) not checked")
+            print(f"Server {name} : {result['stations']} station(s), {result['etms']} ETM(s), {result['errors']} error(s), {result['not_checked']} schedule(s) not checked")
+        metrics.add_server(name, result)
+
+def export_metrics(metrics, metrics_file=None, prometheus_file=None):
+    """Write the metrics of the run to the JSON and Prometheus files which are set."""
+    try:
+        if metrics_file:
+            metrics.write_json(metrics_file)
+        if prometheus_file:
+            metrics.write_prometheus(prometheus_file)
+    except:
+        # The metrics are not worth failing the check
+        logger.exception("The following exception occurred :")
+
+def get_history_rows(matrices, stretches_of_groups):
+    """Flatten the matrices of a date and the stretches of each group for the history.
+    Return the list of (etm, station, group, duration) and the list of (group, stretch)."""
+    durations = []
+    stretches = []
+    for group, matrix in matrices.items():
+        stations = matrix["stations"]
+        for etm in matrix["etms"]:
+            row = matrix["rows"][etm]
+            for column, station in enumerate(stations):
+                duration = matrix["durations"][row*len(stations)+column]
+                if duration != MISSING_DURATION:
+                    durations.append((etm, station, group, duration))
+        stretches.extend((group, stretch) for stretch in stretches_of_groups[group])
+    return durations, stretches
+
+def save_history(config, spotBlock_duration_by_date, metrics=None, stretches_by_date=None):
+    """Store the spotBlock durations and the stretch of every ETM of each date in the history, unless history is false in the config.
+    stretches_by_date are the ones of compute_stretches_by_date, they are computed if they are not given.
+    The dates older than history_max_age_days days are removed."""
+    if not config.get("history", True):
+        return
+    if metrics is None:
+        metrics = RunMetrics()
+    if stretches_by_date is None:
+        stretches_by_date = compute_stretches_by_date(spotBlock_duration_by_date)
+    with metrics.phase("history"):
+        try:
+            with HistoryStore(HISTORY_FILE) as history:
+                run_id = history.start_run(config["max_stretch"])
+                for DATE, matrices in spotBlock_duration_by_date.items():
+                    durations, stretches = get_history_rows(matrices, stretches_by_date[DATE])
+                    history.add_date(run_id, DATE, durations, stretches)
+                history.prune(config.get("history_max_age_days", 365))
+        except sqlite3.Error:
+            # The history is not worth failing the check
+            logger.exception("The following exception occurred :")
+
+def get_archived_matrices(archive, DATE, analysis_pool=None):
+    """Extract the spotBlock durations of the last schedule archived for each station on DATE, in analysis_pool if it is given.
+    Return a dictionnary with the matrix of spotBlock durations of each group of split stations."""
+    records = archive.get_latest_records(DATE)
+    station_names_by_group = {}
+    for meta, offset, length in records:
+        station_names_by_group.setdefault(meta["group"], []).append(meta["station"])
+    matrices = {group: create_spotBlock_matrix(station_names) for group, station_names in station_names_by_group.items()}
+    if analysis_pool is not None:
+        futures = [analysis_pool.submit(analyse_schedule_bytes, meta["station"], archive.read(offset, length)) for meta, offset, length in records]
+    for position, (meta, offset, length) in enumerate(records):
+        matrix = matrices[meta["group"]]
+        try:
+            if analysis_pool is not None:
+                spotBlock_duration_list = futures[position].result()[0]
+            else:
+                spotBlock_duration_list = analyse_schedule(meta["station"], decode_schedule(archive.read(offset, length)))
+        except:
+            # A schedule which can't be read anymore is left out, as a station which couldn't be fetched
+            logger.exception("The following exception occurred :")
+            matrix["failed"].add(meta["station"])
+        else:
+            add_station_to_matrix(matrix, matrix["stations"].index(meta["station"]), spotBlock_duration_list)
+    return matrices
+
+def backtest_archive(config, archive, dates, thresholds):
+    """Replay the schedules archived for the dates, with the extraction and the comparison of the checker and without any request.
+    The stretch of each ETM is computed once and compared with every max_stretch of thresholds.
+    Return a dictionnary with the number of dates, schedules and ETMs replayed and, for each threshold,
+    the number of violations and of dates with at least one violation."""
+    started = time.perf_counter()
+    result = {"dates": 0, "schedules": 0, "etms": 0, "thresholds": {threshold: {"violations": 0, "dates": 0} for threshold in thresholds}}
+    with create_analysis_pool(config) or contextlib.nullcontext() as analysis_pool:
+        for DATE in dates:
+            logger.info(f"Replaying {DATE}")
+            matrices = get_archived_matrices(archive, DATE, analysis_pool)
+            delta_percents = [stretch["delta_percent"] for matrix in matrices.values()
+                              for stretch in compute_spotBlock_stretch(matrix) if stretch["max"] is not None]
+            result["dates"] += 1
+            result["schedules"] += sum(len(matrix["stations"]) for matrix in matrices.values())
+            result["etms"] += sum(len(matrix["etms"]) for matrix in matrices.values())
+            for threshold, counts in result["thresholds"].items():
+                nb_violation = sum(1 for delta_percent in delta_percents if delta_percent >= threshold)
+                counts["violations"] += nb_violation
+                if nb_violation:
+                    counts["dates"] += 1
+    result["duration_seconds"] = time.perf_counter()-started
+    return result
+
+def check_dates(config, list_split_station, dates, use_cache=False, sessions=None, metrics=None, analysis_pool=None, history=False, archive=None):
+    """Check the spotBlock durations of the split stations of every server for every date, without sending any mail.
+    sessions is a dictionnary of the session of each server. If history is True, the durations are stored in the history.
+    If archive is given, the raw schedules are added to it.
+    Return a dictionnary with the violations of each date by (group, ETM), or None for a date whose log is not available,
+    and the dictionnary of the matrices of each date."""
+    if metrics is None:
+        metrics = RunMetrics()
+    spotBlock_duration_by_date = get_spotBlock_duration_of_servers(config, list_split_station, dates, use_cache, sessions, metrics, analysis_pool, archive)
+    # Counted once for all the servers
+    metrics.count("dates", len(dates))
+    metrics.count("stations", len(list_split_station))
+    stretches_by_date = compute_stretches_by_date(spotBlock_duration_by_date)
+    if history:
+        save_history(config, spotBlock_duration_by_date, metrics, stretches_by_date)
+    violations_by_date = {}
+    for DATE in dates:
+        matrices = get_available_matrices(DATE, spotBlock_duration_by_date[DATE])
+        if not matrices:
+            violations_by_date[DATE] = None
+            continue
+        with metrics.phase("compare_spotBlock_duration"):
+            violations_by_date[DATE] = get_spotBlock_violations_of_groups(config, matrices, stretches_by_date[DATE])
+        metrics.count("violations", len(violations_by_date[DATE]))
+    return violations_by_date, spotBlock_duration_by_date
+
+def watch(config, list_split_station, use_cache, metrics_file=None, prometheus_file=None, prometheus_port=None):
+    """Check the watched dates every watch_interval seconds with the same session, until interrupted.
+    Only the violations which are new or resolved since the previous check are reported.
+    The stations not checked are sent at each check, alert_window keeps them from being sent again while they stay out of reach.
+    The metrics of the last check are exported after each check and served on prometheus_port if set."""
+    interval = config.get("watch_interval", 300)
+    known_violations = {}
+    last_metrics = None
+    logger.info(f"Watching every {interval} second(s)")
+    print(f"Watching every {interval} second(s)")
+    if prometheus_port:
+        serve_prometheus(prometheus_port, lambda: last_metrics)
+        logger.info(f"Metrics served on port {prometheus_port}")
+    # The sessions and the analysis processes are kept from one check to the next
+    with contextlib.ExitStack() as stack:
+        sessions = {get_server_name(server_config): stack.enter_context(create_session(server_config)) for server_config in get_server_configs(config)}
+        analysis_pool = stack.enter_context(create_analysis_pool(config) or contextlib.nullcontext())
+        alerts = stack.enter_context(create_alert_dispatcher(config))
+        archive = stack.enter_context(create_archive(config) or contextlib.nullcontext())
+        while True:
+            started = time.monotonic()
+            dates = get_watched_dates(config)
+            metrics = RunMetrics()
+            failed_servers = []
+            try:
+                if use_cache:
+                    evict_schedule_cache(config)
+                if config.get("discovery", False) or "servers" in config:
+                    list_split_station = get_list_split_station_of_servers(config, sessions, failed_servers)
+                violations_by_date, spotBlock_duration_by_date = check_dates(config, list_split_station, dates, use_cache, sessions, metrics, analysis_pool, history=True, archive=archive)
+                violations = {}
+                for DATE, violations_of_date in violations_by_date.items():
+                    for (group, etm), error_msg in (violations_of_date or {}).items():
+                        violations[(DATE, group, etm)] = f"{DATE} : {error_msg}"
+                # A violation can't be resolved on a date where a station wasn't checked
+                incomplete_dates = set()
+                for DATE in dates:
+                    if not report_failed_stations(DATE, spotBlock_duration_by_date[DATE], alerts):
+                        incomplete_dates.add(DATE)
+                for key, error_msg in known_violations.items():
+                    if key[0] in incomplete_dates:
+                        violations.setdefault(key, error_msg)
+            except SystemExit as e:
+                # A failed check must not stop the watch, the next one may succeed
+                logger.error(f"The check of {', '.join(dates)} failed : {e}")
+            else:
+                report_violation_changes(known_violations, violations, dates, alerts, get_station_names_by_group(list_split_station))
+                known_violations = violations
+            if "servers" in config:
+                report_failed_servers(failed_servers, alerts)
+                for server_config in get_server_configs(config):
+                    metrics.add_server(get_server_name(server_config), {"failed": int(get_server_name(server_config) in failed_servers)})
+            # The duration served until the next check is the one of this check
+            metrics.finish()
+            last_metrics = metrics
+            export_metrics(metrics, metrics_file, prometheus_file)
+            time.sleep(max(0, interval-(time.monotonic()-started)))
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(args.verbose, json_log_file=args.json_log)
+    logger.info("------")
+    logger.info("STARTUP")
+    logger.info(f"Schedules decoded with {DECODER}")
+    metrics = RunMetrics()
+    # Read config file
+    with metrics.phase("load_config"):
+        config = load_config(CONFIG_FILE)
+    # Read station list
+    failed_servers = []
+    with metrics.phase("load_list_split_station"):
+        list_split_station = get_list_split_station_of_servers(config, failed_servers=failed_servers)
+    use_cache = not args.no_cache
+    if args.watch:
+        try:
+            watch(config, list_split_station, use_cache, args.metrics, args.prometheus, args.prometheus_port)
+        except KeyboardInterrupt:
+            logger.info("Watch stopped")
+            print("Watch stopped")
+        return
+    if args.date_from:
+        dates = get_dates_to_check(args.date_from, args.date_to)
+    else:
+        dates = [get_date(args.delta)]
+    logger.info(f"Date(s) to check : {', '.join(dates)}")
+    print(f"Date(s) to check : {', '.join(dates)}")
+    if use_cache:
+        evict_schedule_cache(config)
+    # The mails are sent in the background, the last ones when the dispatcher is closed
+    with create_alert_dispatcher(config) as alerts, create_archive(config) or contextlib.nullcontext() as archive:
+        if config.get("pipeline", False):
+            # Each error is sent as soon as its ETM is compared, the result of each date is reported at the end
+            station_names_by_group = get_station_names_by_group(list_split_station)
+
+            def send_violation(DATE, group, etm, error_msg):
+                print(f"{DATE} : {error_msg}", end="")
+                alerts.send('ZettaSpotBlockChecker - 1 error(s) found !', [(get_alert_key(DATE, etm, station_names_by_group[group]), error_msg)], f"Date : {DATE}\n")
+
+            results = run_on_servers(config, list_split_station, lambda server_config, list_split_station_of_server: get_spotBlock_violations_pipelined(
+                server_config, list_split_station_of_server, dates, use_cache, metrics=metrics, on_violation=send_violation, archive=archive))
+            spotBlock_duration_by_date = merge_by_date(result[0] for result in results)
+            violations_by_date = merge_by_date(result[1] for result in results)
+        else:
+            # Get and analyse the schedule of every station of every server for every date in one go.
+            spotBlock_duration_by_date = get_spotBlock_duration_of_servers(config, list_split_station, dates, use_cache, metrics=metrics, archive=archive)
+            violations_by_date = {DATE: None for DATE in dates}
+        # Counted once for all the servers
+        metrics.count("dates", len(dates))
+        metrics.count("stations", len(list_split_station))
+        # Computed once for the history, the comparison and the summary of the servers
+        stretches_by_date = compute_stretches_by_date(spotBlock_duration_by_date)
+        save_history(config, spotBlock_duration_by_date, metrics, stretches_by_date)
+        for DATE in dates:
+            check_spotBlock_duration(config, DATE, spotBlock_duration_by_date[DATE], alerts, metrics, violations_by_date[DATE], stretches_by_date[DATE])
+        if "servers" in config:
+            report_failed_servers(failed_servers, alerts)
+            report_servers(config, list_split_station, spotBlock_duration_by_date, metrics, failed_servers, stretches_by_date)
+    metrics.finish()
+    export_metrics(metrics, args.metrics, args.prometheus)
+
+if __name__ == '__main__':
+    main()